@@ -1,11 +1,139 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any, Tuple, Set
+from typing import List, Optional, Dict, Any, Tuple, Set, Callable
+import asyncio
+import base64
+import bisect
+import cProfile
+import hashlib
+import heapq
+import json
+import logging
+import marshal
+import math
+import multiprocessing
+import operator
+import os
+import queue
 import random
-from collections import defaultdict
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 
-app = FastAPI(title="Schedule Hub CSP API")
+try:
+    import numpy as np
+except ImportError:  # optional: only the CSP-NUMPY strategy needs it
+    np = None
+
+# Worker processes for candidate generation; defaults to one per core
+CSP_WORKERS = int(os.environ.get("CSP_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# Candidate result cache: entry bound, time-to-live in seconds and optional
+# SQLite file so cached timetables survive restarts. CSP_CACHE_SIZE=0 disables it
+CSP_CACHE_SIZE = int(os.environ.get("CSP_CACHE_SIZE", "256"))
+CSP_CACHE_TTL = float(os.environ.get("CSP_CACHE_TTL", "3600"))
+CSP_CACHE_PATH = os.environ.get("CSP_CACHE_PATH") or None
+
+# Background generation jobs: SQLite file holding them and how many may run at once
+CSP_JOBS_PATH = os.environ.get("CSP_JOBS_PATH", "csp_jobs.db")
+CSP_MAX_JOBS = int(os.environ.get("CSP_MAX_JOBS", "2"))
+
+# Folder where /timetables/profile saves each profile and its payload; unset keeps none
+CSP_PROFILE_DIR = os.environ.get("CSP_PROFILE_DIR") or None
+
+# Solver log level and format: "text" lines or "json", one object per record
+CSP_LOG_LEVEL = os.environ.get("CSP_LOG_LEVEL", "INFO").upper()
+CSP_LOG_FORMAT = os.environ.get("CSP_LOG_FORMAT", "text")
+
+# Bump whenever a solver change alters the timetables produced for a given
+# payload and seed, so cached results from older versions are never served
+SOLVER_VERSION = "1"
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_progress_manager = None
+
+
+class LogFormatter(logging.Formatter):
+    """Formats log records with the fields passed as extra={"fields": {...}}.
+    
+    Text lines append them as key=value pairs; JSON lines merge them into
+    the record's object.
+    """
+    
+    def __init__(self, json_lines: bool = False):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        self.json_lines = json_lines
+    
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", {})
+        if self.json_lines:
+            return json.dumps({"time": self.formatTime(record), "level": record.levelname,
+                               "logger": record.name, "message": record.getMessage(), **fields},
+                              default=str)
+        line = super().format(record)
+        if fields:
+            line += " " + " ".join(f"{key}={json.dumps(value, default=str)}" for key, value in fields.items())
+        return line
+
+
+logger = logging.getLogger("csp")
+if not logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(LogFormatter(json_lines=CSP_LOG_FORMAT == "json"))
+    logger.addHandler(_log_handler)
+    logger.setLevel(CSP_LOG_LEVEL)
+    logger.propagate = False
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Create the candidate-generation process pool on first use."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=CSP_WORKERS)
+    return _process_pool
+
+
+def get_progress_manager():
+    """Manager whose queues carry solver progress from worker processes."""
+    global _progress_manager
+    if _progress_manager is None:
+        _progress_manager = multiprocessing.Manager()
+    return _progress_manager
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    global job_store, _job_slots, _process_pool, _progress_manager, _result_cache
+    job_store = JobStore(CSP_JOBS_PATH)
+    resume_jobs()
+    yield
+    # Stop job runners before the pool and manager they use; their jobs stay
+    # running in the store, so resume_jobs picks them up on the next start
+    tasks = list(_job_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _job_slots = None
+    job_store.close()
+    job_store = None
+    if _result_cache is not None:
+        _result_cache.close()
+        _result_cache = None
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+    if _progress_manager is not None:
+        _progress_manager.shutdown()
+        _progress_manager = None
+
+
+app = FastAPI(title="Schedule Hub CSP API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -45,96 +173,152 @@ class GeneratePayload(BaseModel):
     timeslots: List[Dict[str, Any]]  # expected { day: 'Mon', start: '10:00', end: '11:00' }
     breaks: BreaksConfig
     slotMinutes: int = 60
+    # Search budget per candidate in seconds
+    timeLimitSeconds: float = Field(8.0, gt=0, le=3600)
+    # Steps of the post-solve local search (ANNEAL/TABU strategies); None
+    # uses LOCAL_SEARCH_STEPS. The step count alone decides the result, so
+    # a seed always gives the same timetable; localSearchSeconds only caps
+    # the time, and a run it cuts short is marked cutShort and not cached
+    localSearchIterations: Optional[int] = Field(None, ge=1, le=1_000_000)
+    localSearchSeconds: float = Field(5.0, gt=0, le=3600)
+    # Return the deepest partial timetable, with its unplaced sessions, when a
+    # run finds no complete one instead of failing the run
+    allowPartial: bool = False
+    # Split classes that share no instructor or restricted lab room into
+    # sub-problems solved in parallel, each with its own share of the rooms
+    decompose: bool = False
+    # Report per-phase timings, per-constraint counters and domain-size
+    # histograms under stats["instrumentation"], plus every traceEvery-th
+    # search node when traceEvery is set
+    instrument: bool = False
+    traceEvery: int = Field(0, ge=0)
+    # Solver strategies to run, see SOLVER_STRATEGIES; several entries form a portfolio
     algorithms: List[str]
+    # Number of solver runs per request and how many of the best to return (None = all)
+    candidateCount: int = Field(3, ge=1, le=64)
+    topK: Optional[int] = Field(None, ge=1)
+
+class RepairDelta(BaseModel):
+    # Assignments are matched on class and course, plus type when given
+    addAssignments: List[Dict[str, Any]] = []
+    removeAssignments: List[Dict[str, Any]] = []
+    # { class, course, [type], instructor }: hand a course to another instructor
+    instructorChanges: List[Dict[str, Any]] = []
+    addRooms: List[str] = []
+    removeRooms: List[str] = []
+    # Types of added rooms (or new types for existing ones)
+    roomTypes: Dict[str, str] = {}
+    # Timeslot windows in the GeneratePayload format, removed on exact match
+    addTimeslots: List[Dict[str, Any]] = []
+    removeTimeslots: List[Dict[str, Any]] = []
+
+class RepairPayload(BaseModel):
+    # The problem the existing timetable was generated from
+    payload: GeneratePayload
+    # Existing timetable rows in the get_solution "details" format
+    details: List[Dict[str, Any]]
+    delta: RepairDelta = RepairDelta()
+    # Solver strategy for the re-solve, see SOLVER_STRATEGIES
+    algorithm: str = "CSP"
+    seed: int = 42
+
+class ProfilePayload(BaseModel):
+    payload: GeneratePayload
+    # Solver strategy and seed of the profiled run
+    algorithm: str = "CSP"
+    seed: int = 42
+    # How many of the hottest functions to list, and ordered by what
+    top: int = Field(25, ge=1, le=1000)
+    sortBy: str = Field("cumulative", pattern=r"^(cumulative|tottime|calls)$")
+
+def to_minutes(t: str) -> int:
+    """Parse an "HH:MM" string into minutes since midnight."""
+    h, m = t.split(":")
+    return int(h) * 60 + int(m)
+
+
+def from_minutes(x: int) -> str:
+    """Format minutes since midnight as an "HH:MM" string."""
+    return f"{x // 60:02d}:{x % 60:02d}"
+
 
 def duration_in_hours(start: str, end: str) -> float:
-    def to_min(t: str) -> int:
-        h, m = t.split(":")
-        return int(h) * 60 + int(m)
-    return max(0, (to_min(end) - to_min(start))) / 60.0
+    return max(0, (to_minutes(end) - to_minutes(start))) / 60.0
 
 
 def slot_string(start: str, end: str) -> str:
     return f"{start}-{end}"
 
 
-def respects_break(day: str, start: str, end: str, breaks: BreaksConfig) -> bool:
+def break_window(day: str, breaks: BreaksConfig) -> Optional[Tuple[int, int]]:
+    """Resolve the break window for a day as (start, end) minutes, or None."""
     if breaks.mode == "same" and breaks.same:
-        bs, be = breaks.same.start, breaks.same.end
-    elif breaks.mode == "per-day" and breaks.perDay and day in breaks.perDay:
+        return to_minutes(breaks.same.start), to_minutes(breaks.same.end)
+    if breaks.mode == "per-day" and breaks.perDay and day in breaks.perDay:
         bw = breaks.perDay[day]
-        bs, be = bw.start, bw.end
-    else:
-        return True
+        return to_minutes(bw.start), to_minutes(bw.end)
+    return None
 
-    def to_min(t: str) -> int:
-        h, m = t.split(":")
-        return int(h) * 60 + int(m)
 
-    s1, e1 = to_min(start), to_min(end)
-    s2, e2 = to_min(bs), to_min(be)
+def respects_break(start: int, end: int, window: Optional[Tuple[int, int]]) -> bool:
+    if window is None:
+        return True
+    s2, e2 = window
     # no overlap with break window
-    return e1 <= s2 or s1 >= e2
+    return end <= s2 or start >= e2
 
 
-def split_into_slices(start: str, end: str, minutes: int) -> List[tuple]:
-    """Split a window (start,end) into fixed-length slices in minutes.
+def split_into_slices(start: int, end: int, minutes: int) -> List[Tuple[int, int]]:
+    """Split a window (start,end) in minutes into fixed-length slices.
     Note: This creates aligned slices starting at the window start.
     A separate helper will add post-break aligned slices when needed.
     """
-    def to_min(t: str) -> int:
-        h, m = t.split(":")
-        return int(h) * 60 + int(m)
-    def from_min(x: int) -> str:
-        h = x // 60
-        m = x % 60
-        return f"{h:02d}:{m:02d}"
-    s = to_min(start)
-    e = to_min(end)
+    s = start
     out = []
     threshold = max(1, minutes - 10)
-    while s + threshold <= e:
-        nxt = min(s + minutes, e)
-        out.append((from_min(s), from_min(nxt)))
+    while s + threshold <= end:
+        nxt = min(s + minutes, end)
+        out.append((s, nxt))
         s = nxt
     return out
 
-def add_post_break_slices(day: str, start: str, end: str, minutes: int, breaks: BreaksConfig) -> List[tuple]:
+def add_post_break_slices(start: int, end: int, minutes: int,
+                          window: Optional[Tuple[int, int]]) -> List[Tuple[int, int]]:
     """Generate additional slices that start exactly at break end so sessions resume immediately.
     Only added when a break window falls within [start, end].
     """
-    def to_min(t: str) -> int:
-        h, m = t.split(":")
-        return int(h) * 60 + int(m)
-    def from_min(x: int) -> str:
-        h = x // 60
-        m = x % 60
-        return f"{h:02d}:{m:02d}"
-
-    # resolve break window for this day
-    if breaks.mode == "same" and breaks.same:
-        bs, be = breaks.same.start, breaks.same.end
-    elif breaks.mode == "per-day" and breaks.perDay and day in breaks.perDay:
-        bw = breaks.perDay[day]
-        bs, be = bw.start, bw.end
-    else:
+    if window is None:
         return []
 
-    s = to_min(start); e = to_min(end)
-    s2 = to_min(bs); e2 = to_min(be)
+    s2, e2 = window
     # if break overlaps window, start extra series at break end
-    if s2 < e and e2 > s:
-        cur = max(e2, s)
-        out = []
-        threshold = max(1, minutes - 10)
-        while cur + threshold <= e:
-            nxt = min(cur + minutes, e)
-            out.append((from_min(cur), from_min(nxt)))
-            cur = nxt
-        return out
+    if s2 < end and e2 > start:
+        return split_into_slices(max(e2, start), end, minutes)
     return []
 
 
+def lecture_rooms(payload: GeneratePayload) -> List[str]:
+    """Rooms lectures may use: every classroom, or every room if there are none."""
+    class_rooms = [r for r in payload.rooms if payload.roomTypes.get(r, "Class") == "Class"]
+    return class_rooms or payload.rooms
+
+
+def lab_rooms_for_class(payload: GeneratePayload, class_name: str) -> List[str]:
+    """Rooms a lab session of class_name may use.
+    
+    Prefers dedicated lab rooms but can use classrooms if needed.
+    """
+    # Preferred lab rooms: if class-specific restriction provided, honor it
+    if payload.classLabRooms and class_name in payload.classLabRooms:
+        lab_rooms = [r for r in payload.classLabRooms.get(class_name, [])
+                     if payload.roomTypes.get(r, "Class") == "Lab"]
+    else:
+        lab_rooms = [r for r in payload.rooms if payload.roomTypes.get(r, "Class") == "Lab"]
+    
+    # If no dedicated lab rooms matched restriction, fallback to any selected rooms
+    return lab_rooms or payload.rooms
+
+
 class CSPVariable:
     """Represents a variable in the CSP - a class session to be scheduled."""
     def __init__(self, var_id: int, class_name: str, course: str, session_type: str, 
@@ -144,51 +328,598 @@ class CSPVariable:
         self.course = course
         self.session_type = session_type  # 'Lecture' or 'Lab'
         self.instructor = instructor
-        self.assignment: Optional[Tuple] = None  # (room, day, time_slots)
+        self.assignment: Optional[Tuple] = None  # (room, day, time_slots) with slots in minutes
     
     def __repr__(self):
         return f"Var({self.class_name}/{self.course}/{self.session_type})"
 
 
-class CSPDomain:
-    """Represents the domain of possible assignments for a variable."""
+class DomainTable:
+    """Fixed table of (room, day, time_slots) values that domains index into.
+    
+    Alongside the values it keeps bitmasks grouping value indexes by
+    (room, day), by day and by (day, time_slots), so conflict pruning can be done
+    with integer mask operations instead of scanning value tuples.
+    """
     def __init__(self):
-        self.values: List[Tuple] = []  # List of (room, day, time_slots_tuple)
+        self.values: List[Tuple] = []  # List of (room, day, ((start_min, end_min), ...))
+        self.index: Dict[Tuple, int] = {}
+        self.room_day_masks: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.day_masks: Dict[str, int] = defaultdict(int)
+        self.slot_masks: Dict[str, Dict[tuple, int]] = defaultdict(dict)  # day -> time_slots -> mask
+        self._overlap_cache: Dict[Tuple[str, tuple], int] = {}
+        self._vector_view: Optional[Dict[str, Any]] = None
+    
+    def append(self, value: Tuple) -> int:
+        idx = self.index.get(value)
+        if idx is not None:
+            return idx
+        idx = len(self.values)
+        room, day, time_slots = value
+        self.values.append(value)
+        self.index[value] = idx
+        bit = 1 << idx
+        self.room_day_masks[(room, day)] |= bit
+        self.day_masks[day] |= bit
+        day_masks = self.slot_masks[day]
+        day_masks[time_slots] = day_masks.get(time_slots, 0) | bit
+        self._overlap_cache.clear()
+        self._vector_view = None
+        return idx
+    
+    def overlap_mask(self, day: str, time_slots: tuple) -> int:
+        """Mask of every value on day whose slots overlap time_slots."""
+        key = (day, time_slots)
+        mask = self._overlap_cache.get(key)
+        if mask is None:
+            mask = 0
+            for other_slots, slots_mask in self.slot_masks.get(day, {}).items():
+                if any(s1 < e2 and s2 < e1 for s1, e1 in time_slots for s2, e2 in other_slots):
+                    mask |= slots_mask
+            self._overlap_cache[key] = mask
+        return mask
+    
+    def vector_view(self) -> Dict[str, Any]:
+        """NumPy view of the table for batch value ordering.
+        
+        keys lists the distinct (day, time_slots) pairs and key_index maps
+        each value to its key; room_penalty caches per-session-type room
+        penalties filled in by the solver.
+        """
+        if self._vector_view is None:
+            keys: List[Tuple[str, tuple]] = []
+            key_pos: Dict[Tuple[str, tuple], int] = {}
+            key_index = []
+            for _, day, time_slots in self.values:
+                key = (day, time_slots)
+                if key not in key_pos:
+                    key_pos[key] = len(keys)
+                    keys.append(key)
+                key_index.append(key_pos[key])
+            self._vector_view = {
+                "keys": keys,
+                "key_index": np.array(key_index, dtype=np.intp),
+                "room_penalty": {},
+            }
+        return self._vector_view
+    
+    def mask_to_array(self, mask: int) -> "np.ndarray":
+        """Expand a value bitmask into a boolean array over the table."""
+        n = len(self.values)
+        raw = np.frombuffer(mask.to_bytes((n + 7) // 8, "little"), dtype=np.uint8)
+        return np.unpackbits(raw, bitorder="little")[:n].astype(bool)
+
+
+class CSPDomain:
+    """Represents the domain of possible assignments for a variable.
+    
+    Values live in a DomainTable; the domain itself is a bitmask of the
+    table indexes still available, so pruning and restoring are mask
+    operations and iteration always follows table order.
+    """
+    def __init__(self, table: Optional[DomainTable] = None):
+        self.table = table if table is not None else DomainTable()
+        self.mask = 0
+    
+    @property
+    def values(self) -> List[Tuple]:
+        table_values = self.table.values
+        out = []
+        mask = self.mask
+        while mask:
+            low = mask & -mask
+            out.append(table_values[low.bit_length() - 1])
+            mask ^= low
+        return out
     
     def add(self, room: str, day: str, time_slots: tuple):
-        self.values.append((room, day, time_slots))
+        self.mask |= 1 << self.table.append((room, day, time_slots))
     
     def remove(self, value):
-        if value in self.values:
-            self.values.remove(value)
+        idx = self.table.index.get(value)
+        if idx is not None:
+            self.mask &= ~(1 << idx)
+    
+    def __len__(self):
+        return self.mask.bit_count()
     
     def is_empty(self):
-        return len(self.values) == 0
+        return self.mask == 0
     
     def copy(self):
-        new_domain = CSPDomain()
-        new_domain.values = self.values.copy()
+        new_domain = CSPDomain(self.table)
+        new_domain.mask = self.mask
         return new_domain
 
 
+# Search options every strategy starts from
+DEFAULT_SOLVER_OPTIONS: Dict[str, Any] = {
+    "value_order": "lcv",
+    "lcv_backend": "python",
+    "symmetry": False,
+    # "forward" checking only, "ac3" preprocessing, or "mac" (AC-3 at start
+    # and after every assignment)
+    "propagation": "forward",
+    # Conflict-directed backjumping instead of chronological backtracking,
+    # optionally caching the learned nogoods
+    "backjumping": False,
+    "nogoods": False,
+    # "mrv", "mrv-degree" (ties broken by class/instructor neighbours) or
+    # "dom/wdeg" (domain size over failure-weighted degree)
+    "variable_order": "mrv",
+    # Post-solve soft-score improvement: None, "anneal" or "tabu"
+    "local_search": None,
+}
+
+# Solver strategies selectable through GeneratePayload.algorithms
+SOLVER_STRATEGIES: Dict[str, Dict[str, Any]] = {
+    # MRV variable ordering, soft-score (LCV) value ordering, forward checking
+    "CSP": {},
+    # Same search but values are tried in table order without soft scoring;
+    # much cheaper per node, useful for quick previews of large institutes
+    "CSP-FIRSTFIT": {"value_order": "first-fit"},
+    # Same ordering as CSP, scored in one NumPy batch per node (needs numpy)
+    "CSP-NUMPY": {"lcv_backend": "numpy"},
+}
+
+# Optional search features appended to a strategy name, e.g. "CSP+SYMMETRY"
+SOLVER_MODIFIERS: Dict[str, Dict[str, Any]] = {
+    # Sessions of the same class/course/instructor are interchangeable; once a
+    # value is refuted for one of them it is skipped for the others
+    "SYMMETRY": {"symmetry": True},
+    # Make the room/class/instructor constraints arc consistent before search
+    "AC3": {"propagation": "ac3"},
+    # ...and keep them arc consistent after every assignment
+    "MAC": {"propagation": "mac"},
+    # Jump back to the deepest assignment that caused a dead end
+    "CBJ": {"backjumping": True},
+    # CBJ that also remembers each dead end's culprits as a nogood
+    "NOGOODS": {"backjumping": True, "nogoods": True},
+    # Break MRV ties by the number of sessions sharing the class or instructor
+    "DEG": {"variable_order": "mrv-degree"},
+    # Pick the smallest domain relative to how often its constraints failed
+    "WDEG": {"variable_order": "dom/wdeg"},
+    # Improve the solved timetable's soft score with simulated annealing
+    "ANNEAL": {"local_search": "anneal"},
+    # ...or with tabu search
+    "TABU": {"local_search": "tabu"},
+}
+
+# Learned nogoods are kept only up to this many assignments, and at most
+# MAX_NOGOODS of them per solve
+MAX_NOGOOD_SIZE = 4
+MAX_NOGOODS = 10000
+
+# Local search tuning: default steps per strategy; annealing cools geometrically
+# from the start to the end temperature over the steps; tabu scans the TABU_SAMPLE best re-placements
+# of a session per step and forbids undoing a move for TABU_TENURE steps
+LOCAL_SEARCH_STEPS = {"anneal": 3000, "tabu": 200}
+ANNEAL_START_TEMPERATURE = 10.0
+ANNEAL_END_TEMPERATURE = 0.05
+TABU_SAMPLE = 12
+TABU_TENURE = 10
+
+DEFAULT_STRATEGY = "CSP"
+
+# Seeds used for the first candidates; later runs derive theirs from candidate_seed
+CANDIDATE_SEEDS = (42, 1337, 2025)
+
+
+def strategy_options(strategy: str) -> Dict[str, Any]:
+    """Search options for a normalized strategy name such as "CSP-NUMPY+SYMMETRY"."""
+    base, *modifiers = strategy.split("+")
+    options = dict(DEFAULT_SOLVER_OPTIONS)
+    options.update(SOLVER_STRATEGIES[base])
+    for modifier in modifiers:
+        options.update(SOLVER_MODIFIERS[modifier])
+    return options
+
+
+def resolve_strategies(names: List[str]) -> List[str]:
+    """Normalize requested algorithm names, defaulting to DEFAULT_STRATEGY.
+    
+    Names are a strategy optionally followed by "+MODIFIER" parts; the
+    normalized form is upper-case with modifiers sorted.
+    """
+    resolved = []
+    for name in names or [DEFAULT_STRATEGY]:
+        base, *modifiers = [part.strip() for part in str(name).upper().split("+")]
+        if base not in SOLVER_STRATEGIES:
+            raise ValueError(f"Unknown algorithm '{name}'. Supported: {', '.join(SOLVER_STRATEGIES)}")
+        for modifier in modifiers:
+            if modifier not in SOLVER_MODIFIERS:
+                raise ValueError(f"Unknown modifier '{modifier}' in '{name}'. "
+                                 f"Supported: {', '.join(SOLVER_MODIFIERS)}")
+        key = "+".join([base] + sorted(set(modifiers)))
+        if strategy_options(key)["lcv_backend"] == "numpy" and np is None:
+            raise ValueError(f"Algorithm '{name}' requires numpy, which is not installed")
+        if key not in resolved:
+            resolved.append(key)
+    return resolved
+
+
+def candidate_seed(index: int) -> int:
+    if index < len(CANDIDATE_SEEDS):
+        return CANDIDATE_SEEDS[index]
+    return CANDIDATE_SEEDS[index % len(CANDIDATE_SEEDS)] + 7919 * (index // len(CANDIDATE_SEEDS))
+
+
+class SearchFrame:
+    """One level of the explicit backtracking stack."""
+    __slots__ = ("var", "values", "next_index", "mark", "conflicts")
+    
+    def __init__(self, var: CSPVariable, values: List[Tuple], mark: int):
+        self.var = var
+        self.values = values  # ordered candidate values
+        self.next_index = 0
+        self.mark = mark  # trail length before var was assigned
+        self.conflicts = 0  # backjumping: bitmask of stack depths blamed so far
+
+
+# ==================== INSTRUMENTATION ====================
+
+# Solver methods timed by SolverInstrumentation and the phase each counts
+# towards. Timings are inclusive: value ordering contains the soft scoring it
+# triggers, and forward checking contains MAC propagation.
+INSTRUMENTED_PHASES = {
+    "_initialize_domains": "domains",
+    "establish_arc_consistency": "arcConsistency",
+    "select_unassigned_variable": "variableSelection",
+    "order_domain_values": "valueOrdering",
+    "calculate_soft_constraint_score": "softScoring",
+    "forward_check": "forwardChecking",
+    "propagate": "propagation",
+    "undo_to": "undo",
+    "improve": "localSearch",
+    "settle": "localSearch",
+}
+
+# Hard-constraint checks counted when they reject a value, and soft-constraint
+# penalties counted when they are non-zero
+INSTRUMENTED_CHECKS = {
+    "_check_no_room_conflict": "room",
+    "_check_no_class_conflict": "class",
+    "_check_no_instructor_conflict": "instructor",
+}
+INSTRUMENTED_PENALTIES = {
+    "_penalty_same_course_same_day": "sameCourseSameDay",
+    "_penalty_day_overload": "dayOverload",
+    "_penalty_back_to_back": "backToBack",
+    "_penalty_instructor_overload": "instructorOverload",
+    "_penalty_time_preference": "timePreference",
+    "_penalty_schedule_gaps": "scheduleGaps",
+    "_penalty_room_type_mismatch": "roomTypeMismatch",
+}
+
+# A sampled search trace keeps at most this many nodes
+TRACE_LIMIT = 1000
+
+
+class SizeHistogram:
+    """Counts of sizes in power-of-two buckets, keyed by each bucket's upper bound."""
+    
+    def __init__(self):
+        self.buckets: Dict[int, int] = defaultdict(int)
+        self.count = 0
+        self.sum = 0
+    
+    def add(self, size: int):
+        self.buckets[1 << (size - 1).bit_length() if size else 0] += 1
+        self.count += 1
+        self.sum += size
+    
+    def report(self) -> Dict[str, Any]:
+        return {"buckets": {str(bound): self.buckets[bound] for bound in sorted(self.buckets)},
+                "count": self.count, "sum": self.sum}
+
+
+class SolverInstrumentation:
+    """Opt-in diagnostics for one CSPSolver run.
+    
+    attach() shadows the solver's hot methods with instance attributes that
+    wrap them, so a solver built without instrumentation runs the plain
+    methods and pays nothing. Collected: seconds and calls per phase (see
+    INSTRUMENTED_PHASES), values pruned per constraint, values rejected per
+    hard constraint, non-zero soft penalties, domain-size histograms at
+    start and at each variable selection, and with trace_every every
+    trace_every-th search node.
+    """
+    
+    def __init__(self, trace_every: int = 0):
+        self.trace_every = trace_every
+        self.phase_seconds: Dict[str, float] = defaultdict(float)
+        self.phase_calls: Dict[str, int] = defaultdict(int)
+        # Values pruned by forward checking (per clashing constraint), by
+        # arc consistency and by symmetry breaking
+        self.pruned: Dict[str, int] = dict.fromkeys(("class", "instructor", "room", "arc", "symmetry"), 0)
+        self.rejected: Dict[str, int] = dict.fromkeys(INSTRUMENTED_CHECKS.values(), 0)
+        self.soft_hits: Dict[str, int] = dict.fromkeys(INSTRUMENTED_PENALTIES.values(), 0)
+        self.initial_sizes = SizeHistogram()
+        self.selected_sizes = SizeHistogram()
+        self.trace: List[Dict[str, Any]] = []
+        self.nodes = 0
+        self._solver: Optional["CSPSolver"] = None
+        self._propagate_from: Optional[int] = None
+    
+    def attach(self, solver: "CSPSolver"):
+        """Wrap solver's instrumented methods; call before its domains are built."""
+        self._solver = solver
+        for name, check in INSTRUMENTED_CHECKS.items():
+            setattr(solver, name, self._counted(getattr(solver, name), self.rejected, check, operator.not_))
+        for name, penalty in INSTRUMENTED_PENALTIES.items():
+            setattr(solver, name, self._counted(getattr(solver, name), self.soft_hits, penalty, bool))
+        for name, phase in INSTRUMENTED_PHASES.items():
+            setattr(solver, name, self._timed(getattr(solver, name), phase))
+        solver._initialize_domains = self._after(solver._initialize_domains, self._record_initial_domains)
+        solver.select_unassigned_variable = self._selecting(solver.select_unassigned_variable)
+        solver.forward_check = self._forward_checking(solver.forward_check)
+        solver.propagate = self._trail_counted(solver.propagate, "arc", propagation=True)
+        solver.exclude_from_siblings = self._trail_counted(solver.exclude_from_siblings, "symmetry")
+    
+    def _timed(self, method: Callable, phase: str) -> Callable:
+        seconds = self.phase_seconds
+        calls = self.phase_calls
+        clock = time.perf_counter
+        
+        def timed(*args, **kwargs):
+            started = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                seconds[phase] += clock() - started
+                calls[phase] += 1
+        return timed
+    
+    @staticmethod
+    def _counted(method: Callable, counts: Dict[str, int], key: str,
+                 hit: Callable[[Any], bool]) -> Callable:
+        """Count the calls whose result satisfies hit."""
+        def counted(*args, **kwargs):
+            result = method(*args, **kwargs)
+            if hit(result):
+                counts[key] += 1
+            return result
+        return counted
+    
+    @staticmethod
+    def _after(method: Callable, hook: Callable[[], None]) -> Callable:
+        def wrapped(*args, **kwargs):
+            result = method(*args, **kwargs)
+            hook()
+            return result
+        return wrapped
+    
+    def _record_initial_domains(self):
+        for domain in self._solver.domains.values():
+            self.initial_sizes.add(domain.mask.bit_count())
+    
+    def _selecting(self, method: Callable) -> Callable:
+        solver = self._solver
+        
+        def select_unassigned_variable():
+            var = method()
+            if var is not None:
+                size = solver.domains[var.id].mask.bit_count()
+                self.selected_sizes.add(size)
+                self.nodes += 1
+                if self.trace_every and self.nodes % self.trace_every == 0 and len(self.trace) < TRACE_LIMIT:
+                    self.trace.append({
+                        "node": self.nodes,
+                        "elapsed": round(time.time() - solver._start_time, 4),
+                        "depth": sum(1 for v in solver.variables if v.assignment is not None),
+                        "variable": var.id,
+                        "class": var.class_name,
+                        "course": var.course,
+                        "type": var.session_type,
+                        "domainSize": size,
+                        "backtracks": solver.backtracks,
+                    })
+            return var
+        return select_unassigned_variable
+    
+    def _forward_checking(self, method: Callable) -> Callable:
+        """Attribute each forward-checking prune to the constraint that caused it."""
+        solver = self._solver
+        pruned = self.pruned
+        
+        def forward_check(var, assignment, targets=None):
+            start = len(solver.trail)
+            self._propagate_from = None
+            consistent = method(var, assignment, targets)
+            end = self._propagate_from if self._propagate_from is not None else len(solver.trail)
+            variables = solver.variables
+            for other_id, mask in solver.trail[start:end]:
+                other = variables[other_id]
+                if other.class_name == var.class_name:
+                    pruned["class"] += mask.bit_count()
+                elif var.instructor and other.instructor == var.instructor:
+                    pruned["instructor"] += mask.bit_count()
+                else:
+                    pruned["room"] += mask.bit_count()
+            return consistent
+        return forward_check
+    
+    def _trail_counted(self, method: Callable, key: str, propagation: bool = False) -> Callable:
+        """Count the values method prunes, read off the trail entries it pushes."""
+        solver = self._solver
+        pruned = self.pruned
+        
+        def wrapped(*args, **kwargs):
+            start = len(solver.trail)
+            if propagation:
+                # MAC runs at the end of forward_check; keep its prunes out of FC's
+                self._propagate_from = start
+            result = method(*args, **kwargs)
+            pruned[key] += sum(mask.bit_count() for _, mask in solver.trail[start:])
+            return result
+        return wrapped
+    
+    def report(self) -> Dict[str, Any]:
+        return {
+            "phases": {phase: {"seconds": round(self.phase_seconds[phase], 4),
+                               "calls": self.phase_calls[phase]}
+                       for phase in dict.fromkeys(INSTRUMENTED_PHASES.values())
+                       if self.phase_calls[phase]},
+            "pruned": dict(self.pruned),
+            "rejected": dict(self.rejected),
+            "softHits": dict(self.soft_hits),
+            "domainSizes": {"initial": self.initial_sizes.report(),
+                            "atSelection": self.selected_sizes.report()},
+            "nodes": self.nodes,
+            "traceEvery": self.trace_every,
+            "trace": self.trace,
+        }
+
+
+def solver_instrumentation(payload: GeneratePayload) -> Optional[SolverInstrumentation]:
+    """Instrumentation for a solve of payload, or None when it did not ask for any."""
+    if not payload.instrument:
+        return None
+    return SolverInstrumentation(payload.traceEvery)
+
+
 class CSPSolver:
     """Constraint Satisfaction Problem solver for timetable scheduling."""
     
-    def __init__(self, payload: GeneratePayload, seed: int, max_seconds: float = 8.0):
-        random.seed(seed)
+    def __init__(self, payload: GeneratePayload, seed: int, max_seconds: float = 8.0,
+                 strategy: str = DEFAULT_STRATEGY,
+                 progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 should_stop: Optional[Callable[[], bool]] = None,
+                 progress_interval: float = 0.5,
+                 instrumentation: Optional[SolverInstrumentation] = None):
         self.payload = payload
         self.seed = seed
+        # Solver-owned RNG: concurrent solves never share random state, and
+        # the same seed always reproduces the same timetable
+        self.rng = random.Random(seed)
         self.max_seconds = max_seconds
-        import time
+        self.strategy = strategy
+        self.options = strategy_options(strategy)
         self._start_time = time.time()
+        # Optional hooks polled every progress_interval seconds: progress gets
+        # progress_snapshot(), and should_stop() returning True ends the search
+        # the same way a timeout does
+        self.progress = progress
+        self.should_stop = should_stop
+        self.progress_interval = progress_interval
+        self._next_poll = self._start_time + progress_interval
+        self.stopped = False
         self.variables: List[CSPVariable] = []
         self.domains: Dict[int, CSPDomain] = {}
         self.constraints_checked = 0
         self.backtracks = 0
+        # Arc-consistency counters: arcs revised, values pruned before search
+        # and values pruned by MAC during search
+        self.arc_revisions = 0
+        self.arc_pruned_initial = 0
+        self.arc_pruned_search = 0
+        self._solve_seconds = 0.0
+        # Seconds from solve() to the first complete assignment, before local search
+        self._first_solution_seconds: Optional[float] = None
+        # Deepest partial assignment seen at a dead end or timeout, as one
+        # value (or None) per variable, and whether the search timed out
+        self.best_partial: Optional[List[Optional[Tuple]]] = None
+        self._best_partial_count = 0
+        self._assigned_at_start = 0
+        self.timed_out = False
+        # Repair: var_id -> previous value, tried before any other value
+        self.preferred: Dict[int, Tuple] = {}
+        # Local search results
+        self.soft_score_before: Optional[float] = None
+        self.local_search_iterations = 0
+        self.local_search_moves = 0
+        # Set when the time limit or should_stop ended a stage early, so the
+        # result depends on timing rather than on the seed alone
+        self.cut_short = False
+        # Domain masks when search started; local search draws moves from them
+        self._root_masks: Dict[int, int] = {}
+        # Backjumping counters
+        self.backjumps = 0
+        self.levels_skipped = 0
+        self.nogoods_learned = 0
+        self.nogood_hits = 0
+        
+        # Occupancy indexes: (room|class|instructor, day) -> {var_id: time_slots}
+        # Maintained by assign/unassign so conflict checks only look at one bucket
+        self.room_occupancy: Dict[Tuple[str, str], Dict[int, tuple]] = defaultdict(dict)
+        self.class_occupancy: Dict[Tuple[str, str], Dict[int, tuple]] = defaultdict(dict)
+        self.instructor_occupancy: Dict[Tuple[str, str], Dict[int, tuple]] = defaultdict(dict)
+        
+        # Soft-constraint aggregates, also maintained by assign/unassign. The
+        # occupancy buckets above double as per-(class, day) and
+        # per-(instructor, day) session counts.
+        # (class, course, day) -> {var_id: time_slots}
+        self.course_day_occupancy: Dict[Tuple[str, str, str], Dict[int, tuple]] = defaultdict(dict)
+        # (class, day) -> sorted list of occupied (start, end) slots
+        self.class_day_intervals: Dict[Tuple[str, str], List[Tuple[int, int]]] = defaultdict(list)
+        
+        # Undo trail shared by the whole search: (var_id, pruned_mask) for a
+        # domain prune, (var_id, 0) for an assignment. Backtracking rewinds
+        # it to a saved mark instead of replaying per-node removal records.
+        self.trail: List[Tuple[int, int]] = []
+        
+        # Backjumping only: for every prune on the trail, the stack depths it
+        # depends on as a bitmask (var_id -> stack parallel to its prunes).
+        # _reason_exact blames the assignment being forward checked,
+        # _reason_upto every assignment up to and including it.
+        self.prune_reasons: Optional[Dict[int, List[int]]] = (
+            defaultdict(list) if self.options["backjumping"] else None)
+        self._reason_exact = 0
+        self._reason_upto = 0
+        self._var_depth: Dict[int, int] = {}
+        # (var_id, value) -> learned nogoods containing it, each a tuple of
+        # (var_id, value) assignments that cannot hold together
+        self.nogoods: Dict[Tuple[int, Tuple], List[Tuple[Tuple[int, Tuple], ...]]] = defaultdict(list)
+        
+        # Interchangeable sessions: var_id -> ids of its sibling group
+        # (only filled with the symmetry option)
+        self.sibling_groups: Dict[int, List[int]] = {}
+        
+        # var_id -> ids sharing its class or instructor, i.e. the variables it
+        # can never overlap in time (only filled with AC-3/MAC propagation or
+        # degree-based variable ordering)
+        self.tight_neighbours: Dict[int, Set[int]] = {}
+        
+        # Variable selection: lazily keyed min-heap of (priority, var_id).
+        # Entries go stale as domains change; shrinking a domain or bumping a
+        # weight pushes a fresh entry, and select_unassigned_variable re-keys
+        # stale ones it meets at the top. None until the first selection.
+        self._var_heap: Optional[List[Tuple[Tuple, int]]] = None
+        # dom/wdeg: static class/instructor degree plus one per failure
+        self.var_weights: Dict[int, int] = {}
+        
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            instrumentation.attach(self)
         
         # Initialize data structures
         self._initialize_variables()
         self._initialize_domains()
+        if self.options["symmetry"]:
+            self._initialize_sibling_groups()
+        if self.options["propagation"] != "forward" or self.options["variable_order"] != "mrv":
+            self._initialize_tight_neighbours()
+            self.var_weights = {var_id: len(ids) + 1 for var_id, ids in self.tight_neighbours.items()}
     
     def _initialize_variables(self):
         """Create CSP variables from assignments.
@@ -243,38 +974,87 @@ class CSPSolver:
         lab_count = sum(1 for v in self.variables if v.session_type == "Lab")
         lecture_count = len(self.variables) - lab_count
         
-        print(f"Initializing domains for {len(self.variables)} variables:")
-        print(f"  - {lecture_count} theory sessions")
-        print(f"  - {lab_count} lab sessions")
-        print(f"  - {len(self.payload.rooms)} rooms available")
-        print(f"  - {sum(len(slots) for slots in slots_by_day.values())} total time slots")
-        
+        logger.info("Initializing domains", extra={"fields": {
+            "variables": len(self.variables),
+            "lectures": lecture_count,
+            "labs": lab_count,
+            "rooms": len(self.payload.rooms),
+            "timeSlots": sum(len(slots) for slots in slots_by_day.values()),
+        }})
+        
+        # Variables with the same session type and room pool have identical
+        # domains, so each template is built once and its value table shared;
+        # a copy only duplicates the bitmask
+        templates: Dict[Tuple, CSPDomain] = {}
         empty_domain_vars = []
         for var in self.variables:
-            domain = CSPDomain()
-            
             if var.session_type == "Lab":
-                # Lab needs consecutive slots (prefer 3, allow 2 as fallback)
-                self._add_lab_domain_values(domain, slots_by_day, var)
+                lab_rooms = self._lab_rooms_for(var)
+                key = ("Lab", tuple(lab_rooms))
             else:
-                # Lecture needs 1 slot
-                self._add_lecture_domain_values(domain, slots_by_day, var)
+                key = ("Lecture",)
+            
+            template = templates.get(key)
+            if template is None:
+                template = CSPDomain()
+                if var.session_type == "Lab":
+                    # Lab needs consecutive slots (prefer 3, allow 2 as fallback)
+                    self._add_lab_domain_values(template, slots_by_day, lab_rooms)
+                else:
+                    # Lecture needs 1 slot
+                    self._add_lecture_domain_values(template, slots_by_day)
+                templates[key] = template
             
+            domain = template.copy()
             if domain.is_empty():
                 empty_domain_vars.append(var)
             
             self.domains[var.id] = domain
         
         if empty_domain_vars:
-            print(f"\nWARNING: {len(empty_domain_vars)} variables have empty domains:")
-            for v in empty_domain_vars[:5]:
-                print(f"  - {v}")
-            if len(empty_domain_vars) > 5:
-                print(f"  ... and {len(empty_domain_vars) - 5} more")
-    
-    def _get_slots_by_day(self) -> Dict[str, List[Tuple[str, str]]]:
-        """Extract and organize time slots by day, respecting breaks."""
+            logger.warning("Variables with empty domains", extra={"fields": {
+                "count": len(empty_domain_vars),
+                "sample": [str(v) for v in empty_domain_vars[:5]],
+            }})
+    
+    def _initialize_sibling_groups(self):
+        """Group sessions that are interchangeable for symmetry breaking.
+        
+        Sessions with the same class, course, type and instructor share a
+        domain and every constraint, so swapping their values maps solutions
+        to solutions; backtrack uses this through exclude_from_siblings.
+        """
+        groups: Dict[Tuple, List[int]] = defaultdict(list)
+        for var in self.variables:
+            groups[(var.class_name, var.course, var.session_type, var.instructor)].append(var.id)
+        for ids in groups.values():
+            if len(ids) > 1:
+                for var_id in ids:
+                    self.sibling_groups[var_id] = ids
+    
+    def _initialize_tight_neighbours(self):
+        """Index the class/instructor constraint graph for arc consistency."""
+        groups: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+        for var in self.variables:
+            groups[("class", var.class_name)].append(var.id)
+            if var.instructor:
+                groups[("instructor", var.instructor)].append(var.id)
+        for var in self.variables:
+            self.tight_neighbours[var.id] = set()
+        for ids in groups.values():
+            for var_id in ids:
+                self.tight_neighbours[var_id].update(ids)
+        for var_id, neighbours in self.tight_neighbours.items():
+            neighbours.discard(var_id)
+    
+    def _get_slots_by_day(self) -> Dict[str, List[Tuple[int, int]]]:
+        """Extract and organize time slots by day, respecting breaks.
+        
+        Times are parsed once here; every slot downstream is a (start, end)
+        pair of minutes since midnight.
+        """
         slots_by_day = {}
+        windows: Dict[str, Optional[Tuple[int, int]]] = {}
         
         for ts in self.payload.timeslots:
             day = ts.get("day")
@@ -284,13 +1064,18 @@ class CSPSolver:
             if not day or not start or not end:
                 continue
             
+            if day not in windows:
+                windows[day] = break_window(day, self.payload.breaks)
+            window = windows[day]
+            start, end = to_minutes(start), to_minutes(end)
+            
             # Split into fixed-length slices
             slices = split_into_slices(start, end, self.payload.slotMinutes)
             # Add slices starting exactly at break end to resume immediately
-            slices += add_post_break_slices(day, start, end, self.payload.slotMinutes, self.payload.breaks)
+            slices += add_post_break_slices(start, end, self.payload.slotMinutes, window)
             
             for s, e in slices:
-                if respects_break(day, s, e, self.payload.breaks):
+                if respects_break(s, e, window):
                     if day not in slots_by_day:
                         slots_by_day[day] = []
                     slots_by_day[day].append((s, e))
@@ -306,24 +1091,15 @@ class CSPSolver:
         
         return slots_by_day
     
-    def _add_lab_domain_values(self, domain: CSPDomain, slots_by_day: Dict, var: CSPVariable):
+    def _lab_rooms_for(self, var: CSPVariable) -> List[str]:
+        """Rooms a lab session may use, see lab_rooms_for_class."""
+        return lab_rooms_for_class(self.payload, var.class_name)
+    
+    def _add_lab_domain_values(self, domain: CSPDomain, slots_by_day: Dict, lab_rooms: List[str]):
         """Add all possible lab slot combinations to domain.
         
         Labs require consecutive time slots (ideally 3 hours).
-        Prefers dedicated lab rooms but can use classrooms if needed.
         """
-        # Preferred lab rooms: if class-specific restriction provided, honor it
-        if self.payload.classLabRooms and var.class_name in self.payload.classLabRooms:
-            lab_rooms = [r for r in self.payload.classLabRooms.get(var.class_name, [])
-                         if self.payload.roomTypes.get(r, "Class") == "Lab"]
-        else:
-            lab_rooms = [r for r in self.payload.rooms 
-                         if self.payload.roomTypes.get(r, "Class") == "Lab"]
-        
-        # If no dedicated lab rooms matched restriction, fallback to any selected rooms
-        if not lab_rooms:
-            lab_rooms = self.payload.rooms
-        
         if not lab_rooms:
             return  # No rooms available at all
         
@@ -345,19 +1121,14 @@ class CSPSolver:
                         domain.add(room, day, tuple(block))
                         total_options += 1
     
-    def _add_lecture_domain_values(self, domain: CSPDomain, slots_by_day: Dict, var: CSPVariable):
+    def _add_lecture_domain_values(self, domain: CSPDomain, slots_by_day: Dict):
         """Add all possible lecture slot combinations to domain.
         
         Theory courses need single 1-hour slots.
         Can use any classroom, and also lab rooms when they're available.
         """
-        # Get all classroom-type rooms
-        class_rooms = [r for r in self.payload.rooms 
-                      if self.payload.roomTypes.get(r, "Class") == "Class"]
-        
-        # If no dedicated classrooms, use all available rooms (including labs)
-        if not class_rooms:
-            class_rooms = self.payload.rooms
+        # Classroom-type rooms, or all available rooms (including labs) if none
+        class_rooms = lecture_rooms(self.payload)
         
         if not class_rooms:
             raise ValueError("No rooms available for scheduling")
@@ -368,7 +1139,7 @@ class CSPSolver:
                 for room in class_rooms:
                     domain.add(room, day, (slot,))
     
-    def _find_consecutive_blocks(self, slots: List[Tuple[str, str]], count: int) -> List[List[Tuple[str, str]]]:
+    def _find_consecutive_blocks(self, slots: List[Tuple[int, int]], count: int) -> List[List[Tuple[int, int]]]:
         """Find consecutive time slot blocks of given count."""
         blocks = []
         
@@ -419,48 +1190,27 @@ class CSPSolver:
     def _check_no_room_conflict(self, room: str, day: str, time_slots: tuple, 
                                 current_var: CSPVariable) -> bool:
         """Ensure room is not already occupied at this time."""
-        for var in self.variables:
-            if var.id == current_var.id or var.assignment is None:
-                continue
-            
-            assigned_room, assigned_day, assigned_slots = var.assignment
-            
-            if assigned_room == room and assigned_day == day:
-                # Check for time overlap
-                if self._slots_overlap(time_slots, assigned_slots):
-                    return False
-        
-        return True
+        return not self._bucket_conflicts(self.room_occupancy.get((room, day)), time_slots, current_var)
     
     def _check_no_class_conflict(self, class_name: str, day: str, time_slots: tuple,
                                  current_var: CSPVariable) -> bool:
         """Ensure class doesn't have overlapping sessions."""
-        for var in self.variables:
-            if var.id == current_var.id or var.assignment is None:
-                continue
-            
-            if var.class_name == class_name:
-                _, assigned_day, assigned_slots = var.assignment
-                
-                if assigned_day == day and self._slots_overlap(time_slots, assigned_slots):
-                    return False
-        
-        return True
+        return not self._bucket_conflicts(self.class_occupancy.get((class_name, day)), time_slots, current_var)
     
     def _check_no_instructor_conflict(self, instructor: str, day: str, time_slots: tuple,
                                      current_var: CSPVariable) -> bool:
         """Ensure instructor doesn't have overlapping sessions."""
-        for var in self.variables:
-            if var.id == current_var.id or var.assignment is None:
-                continue
-            
-            if var.instructor == instructor:
-                _, assigned_day, assigned_slots = var.assignment
-                
-                if assigned_day == day and self._slots_overlap(time_slots, assigned_slots):
-                    return False
-        
-        return True
+        return not self._bucket_conflicts(self.instructor_occupancy.get((instructor, day)), time_slots, current_var)
+    
+    def _bucket_conflicts(self, bucket: Optional[Dict[int, tuple]], time_slots: tuple,
+                          current_var: CSPVariable) -> bool:
+        """Check time_slots against the sessions already held in one occupancy bucket."""
+        if not bucket:
+            return False
+        for var_id, assigned_slots in bucket.items():
+            if var_id != current_var.id and self._slots_overlap(time_slots, assigned_slots):
+                return True
+        return False
     
     def _check_room_type(self, session_type: str, room: str) -> bool:
         """Check if room type matches session type.
@@ -480,20 +1230,8 @@ class CSPSolver:
     
     def _slots_overlap(self, slots1: tuple, slots2: tuple) -> bool:
         """Check if two sets of time slots overlap."""
-        def to_minutes(time_str: str) -> int:
-            h, m = time_str.split(":")
-            return int(h) * 60 + int(m)
-        
-        # Get time ranges for both slot sets
-        for s1, e1 in slots1:
-            start1 = to_minutes(s1)
-            end1 = to_minutes(e1)
-            
-            for s2, e2 in slots2:
-                start2 = to_minutes(s2)
-                end2 = to_minutes(e2)
-                
-                # Check overlap
+        for start1, end1 in slots1:
+            for start2, end2 in slots2:
                 if start1 < end2 and start2 < end1:
                     return True
         
@@ -507,8 +1245,23 @@ class CSPSolver:
         Optimizes for realistic academic scheduling with multiple theory courses
         and labs per class, ensuring good distribution and minimal conflicts.
         """
-        score = 0.0
         room, day, time_slots = assignment
+        score = self._slot_soft_score(var, day, time_slots)
+        
+        # Soft Constraint 7: Prefer proper room types
+        # Bonus for using correct room type (lab in lab room, etc)
+        score += self._penalty_room_type_mismatch(var.session_type, room) * 3
+        
+        return score
+    
+    def _slot_soft_score(self, var: CSPVariable, day: str, time_slots: tuple) -> float:
+        """Soft constraints 1-6, which depend on the day and slots but not the room.
+        
+        calculate_soft_constraint_score adds the room term last, so the
+        batch ordering path can reuse this per (day, slots) and still get
+        bit-identical scores.
+        """
+        score = 0.0
         
         # Soft Constraint 1: Avoid multiple sessions of same course on same day
         # Important for theory courses with 2-3 sessions per week
@@ -534,22 +1287,14 @@ class CSPSolver:
         # Reduces idle time between sessions for students
         score += self._penalty_schedule_gaps(var.class_name, day, time_slots) * 7
         
-        # Soft Constraint 7: Prefer proper room types
-        # Bonus for using correct room type (lab in lab room, etc)
-        score += self._penalty_room_type_mismatch(var.session_type, room) * 3
-        
         return score
     
     def _penalty_same_course_same_day(self, var: CSPVariable, day: str) -> float:
         """Penalty for scheduling same course multiple times on same day."""
-        count = 0
-        for v in self.variables:
-            if v.id != var.id and v.assignment is not None:
-                if (v.class_name == var.class_name and 
-                    v.course == var.course and 
-                    v.assignment[1] == day):
-                    count += 1
-        return count
+        bucket = self.course_day_occupancy.get((var.class_name, var.course, day))
+        if not bucket:
+            return 0
+        return len(bucket) - (1 if var.id in bucket else 0)
     
     def _penalty_day_overload(self, class_name: str, day: str) -> float:
         """Penalty for having too many sessions on same day.
@@ -557,11 +1302,7 @@ class CSPSolver:
         With 5+ theory courses and 3 labs, classes may have 15+ sessions/week.
         Aim for 3-4 sessions per day across 5 days.
         """
-        count = 0
-        for v in self.variables:
-            if v.assignment is not None and v.class_name == class_name:
-                if v.assignment[1] == day:
-                    count += 1
+        count = len(self.class_occupancy.get((class_name, day), ()))
         
         # Progressive penalty: ideal is 3-4 sessions per day
         if count <= 3:
@@ -589,17 +1330,12 @@ class CSPSolver:
     
     def _penalty_back_to_back(self, var: CSPVariable, day: str, time_slots: tuple) -> float:
         """Penalty for back-to-back sessions of same course."""
-        for v in self.variables:
-            if v.id != var.id and v.assignment is not None:
-                if (v.class_name == var.class_name and 
-                    v.course == var.course and 
-                    v.assignment[1] == day):
-                    
-                    assigned_slots = v.assignment[2]
-                    
-                    # Check if slots are adjacent
-                    if self._slots_adjacent(time_slots, assigned_slots):
-                        return 1.0
+        bucket = self.course_day_occupancy.get((var.class_name, var.course, day))
+        if bucket:
+            for var_id, assigned_slots in bucket.items():
+                # Check if slots are adjacent
+                if var_id != var.id and self._slots_adjacent(time_slots, assigned_slots):
+                    return 1.0
         return 0
     
     def _penalty_instructor_overload(self, instructor: Optional[str], day: str) -> float:
@@ -607,11 +1343,7 @@ class CSPSolver:
         if not instructor:
             return 0
         
-        count = 0
-        for v in self.variables:
-            if v.assignment is not None and v.instructor == instructor:
-                if v.assignment[1] == day:
-                    count += 1
+        count = len(self.instructor_occupancy.get((instructor, day), ()))
         
         if count > 5:
             return count - 5
@@ -619,14 +1351,8 @@ class CSPSolver:
     
     def _penalty_time_preference(self, time_slots: tuple) -> float:
         """Penalty for undesirable time slots (too early or too late)."""
-        def to_minutes(time_str: str) -> int:
-            h, m = time_str.split(":")
-            return int(h) * 60 + int(m)
-        
         penalty = 0
-        for start, _ in time_slots:
-            start_min = to_minutes(start)
-            
+        for start_min, _ in time_slots:
             # Prefer times between 9 AM and 5 PM
             if start_min < 9 * 60:  # Before 9 AM
                 penalty += 0.5
@@ -636,25 +1362,19 @@ class CSPSolver:
         return penalty
     
     def _penalty_schedule_gaps(self, class_name: str, day: str, time_slots: tuple) -> float:
-        """Penalty for creating gaps in class schedule."""
-        def to_minutes(time_str: str) -> int:
-            h, m = time_str.split(":")
-            return int(h) * 60 + int(m)
-        
-        # Get all slots for this class on this day
-        class_slots = []
-        for v in self.variables:
-            if v.assignment is not None and v.class_name == class_name:
-                if v.assignment[1] == day:
-                    for s, e in v.assignment[2]:
-                        class_slots.append((to_minutes(s), to_minutes(e)))
-        
-        # Add current slots
-        for s, e in time_slots:
-            class_slots.append((to_minutes(s), to_minutes(e)))
-        
-        # Sort by start time
-        class_slots.sort()
+        """Penalty for creating gaps in class schedule.
+        
+        Merges time_slots into the class's sorted slots for the day and sums
+        gaps left to right, which keeps the float result identical to a full
+        recomputation; the list is bounded by the slots in one day.
+        """
+        # Already sorted slots for this class on this day, plus current slots
+        class_slots = self.class_day_intervals.get((class_name, day), [])
+        if class_slots:
+            class_slots = class_slots + list(time_slots)
+            class_slots.sort()
+        else:
+            class_slots = sorted(time_slots)
         
         # Calculate total gap time
         gap_penalty = 0
@@ -682,27 +1402,51 @@ class CSPSolver:
     # ==================== VARIABLE ORDERING HEURISTICS ====================
     
     def select_unassigned_variable(self) -> Optional[CSPVariable]:
-        """Select next variable using MRV (Minimum Remaining Values) heuristic."""
-        unassigned = [v for v in self.variables if v.assignment is None]
-        
-        if not unassigned:
-            return None
-        
-        # MRV: Choose variable with smallest domain
-        min_domain_size = float('inf')
-        best_var = None
-        
-        for var in unassigned:
-            domain_size = len(self.domains[var.id].values)
-            
-            if domain_size == 0:
-                return var  # Dead end, return immediately
-            
-            if domain_size < min_domain_size:
-                min_domain_size = domain_size
-                best_var = var
+        """Select next variable using MRV (Minimum Remaining Values) heuristic.
         
-        return best_var
+        Ties go to the lowest variable id, or with the mrv-degree order to
+        the variable sharing a class/instructor with the most others; the
+        dom/wdeg order ranks by domain size over failure-weighted degree.
+        """
+        heap = self._var_heap
+        if heap is None or len(heap) > 8 * len(self.variables) + 64:
+            heap = self._var_heap = [(self._var_priority(v.id), v.id)
+                                     for v in self.variables if v.assignment is None]
+            heapq.heapify(heap)
+        
+        variables = self.variables
+        while heap:
+            priority, var_id = heap[0]
+            if variables[var_id].assignment is not None:
+                heapq.heappop(heap)
+                continue
+            current = self._var_priority(var_id)
+            if current != priority:
+                heapq.heapreplace(heap, (current, var_id))
+                continue
+            return variables[var_id]
+        return None
+    
+    def _var_priority(self, var_id: int) -> Tuple:
+        """Heap key for var_id under the configured variable order."""
+        size = self.domains[var_id].mask.bit_count()
+        order = self.options["variable_order"]
+        if order == "mrv":
+            return (size,)
+        if order == "mrv-degree":
+            return (size, -len(self.tight_neighbours[var_id]))
+        return (size / self.var_weights[var_id],)
+    
+    def _requeue(self, var_id: int):
+        """Push a fresh heap entry after var_id's priority may have dropped."""
+        if self._var_heap is not None:
+            heapq.heappush(self._var_heap, (self._var_priority(var_id), var_id))
+    
+    def _bump_weight(self, var_id: int, culprit_id: int):
+        """dom/wdeg: a wipe-out of culprit_id while checking var_id weighs both."""
+        for weighted_id in (var_id, culprit_id):
+            self.var_weights[weighted_id] += 1
+            self._requeue(weighted_id)
     
     # ==================== VALUE ORDERING HEURISTICS ====================
     
@@ -710,122 +1454,1020 @@ class CSPSolver:
         """Order domain values using Least Constraining Value heuristic."""
         domain = self.domains[var.id]
         
-        # Score each value by soft constraints
+        if self.options["value_order"] == "first-fit":
+            return [value for value in domain.values if self.check_hard_constraints(var, value)]
+        if self.options["lcv_backend"] == "numpy":
+            return self._order_domain_values_numpy(var)
+        
+        # Score each value by soft constraints; equal scores are broken by a
+        # draw from the solver's RNG so each seed explores a different order
+        rng = self.rng
         scored_values = []
         for value in domain.values:
             if self.check_hard_constraints(var, value):
                 score = self.calculate_soft_constraint_score(var, value)
-                scored_values.append((score, value))
+                scored_values.append((score, rng.random(), value))
         
         # Sort by score (lower is better)
-        scored_values.sort(key=lambda x: x[0])
+        scored_values.sort(key=lambda x: (x[0], x[1]))
+        
+        return [v for _, _, v in scored_values]
+    
+    def _order_domain_values_numpy(self, var: CSPVariable) -> List[Tuple]:
+        """Batch version of LCV ordering; returns exactly the scalar order.
         
-        return [v for _, v in scored_values]
+        Hard constraints become one conflict bitmask over the table. Soft
+        scores are computed once per distinct (day, slots) and combined with
+        the per-room term as arrays. Tie-break draws are taken in table order
+        like the scalar path, then everything is sorted with lexsort.
+        """
+        domain = self.domains[var.id]
+        table = domain.table
+        view = table.vector_view()
+        self.constraints_checked += len(domain)
+        
+        feasible = domain.mask & ~self._conflict_mask(var, table)
+        if not feasible:
+            return []
+        idx = np.flatnonzero(table.mask_to_array(feasible))
+        key_index = view["key_index"][idx]
+        
+        keys = view["keys"]
+        slot_scores = np.zeros(len(keys))
+        for k in np.unique(key_index):
+            day, time_slots = keys[k]
+            slot_scores[k] = self._slot_soft_score(var, day, time_slots)
+        
+        room_penalty = view["room_penalty"].get(var.session_type)
+        if room_penalty is None:
+            room_penalty = np.array([self._penalty_room_type_mismatch(var.session_type, room) * 3
+                                     for room, _, _ in table.values], dtype=float)
+            view["room_penalty"][var.session_type] = room_penalty
+        scores = slot_scores[key_index] + room_penalty[idx]
+        
+        rng = self.rng
+        ties = np.array([rng.random() for _ in range(len(idx))])
+        order = np.lexsort((ties, scores))
+        values = table.values
+        return [values[i] for i in idx[order]]
+    
+    def _conflict_mask(self, var: CSPVariable, table: DomainTable) -> int:
+        """Bitmask of table values that clash with current room, class or instructor bookings."""
+        room_mask, class_mask, instructor_mask = self._conflict_masks(var, table)
+        return room_mask | class_mask | instructor_mask
+    
+    def _conflict_masks(self, var: CSPVariable, table: DomainTable) -> Tuple[int, int, int]:
+        """Bitmasks of table values clashing with current room, class and instructor bookings."""
+        blocked = [0, 0, 0]
+        overlap_mask = table.overlap_mask
+        for (room, day), room_mask in table.room_day_masks.items():
+            bucket = self.room_occupancy.get((room, day))
+            if bucket:
+                for var_id, assigned_slots in bucket.items():
+                    if var_id != var.id:
+                        blocked[0] |= overlap_mask(day, assigned_slots) & room_mask
+        for day in table.slot_masks:
+            for kind, occupancy, owner in ((1, self.class_occupancy, var.class_name),
+                                           (2, self.instructor_occupancy, var.instructor)):
+                bucket = occupancy.get((owner, day)) if owner else None
+                if bucket:
+                    for var_id, assigned_slots in bucket.items():
+                        if var_id != var.id:
+                            blocked[kind] |= overlap_mask(day, assigned_slots)
+        return blocked[0], blocked[1], blocked[2]
     
     # ==================== FORWARD CHECKING ====================
     
-    def forward_check(self, var: CSPVariable, assignment: Tuple) -> Dict[int, CSPDomain]:
-        """Perform forward checking to prune domains of unassigned variables."""
-        removed_values = defaultdict(list)
+    def forward_check(self, var: CSPVariable, assignment: Tuple,
+                      targets: Optional[List[CSPVariable]] = None) -> bool:
+        """Perform forward checking to prune domains of unassigned variables.
         
+        Every prune is pushed onto the trail. Returns False as soon as a
+        domain is wiped out. targets limits the check to those variables.
+        """
         room, day, time_slots = assignment
+        trail = self.trail
+        reasons = self.prune_reasons
+        heap = self._var_heap
+        start = len(trail)
         
-        for other_var in self.variables:
+        for other_var in (self.variables if targets is None else targets):
             if other_var.id == var.id or other_var.assignment is not None:
                 continue
             
             domain = self.domains[other_var.id]
-            values_to_remove = []
+            table = domain.table
+            overlap = table.overlap_mask(day, time_slots) & domain.mask
+            if not overlap:
+                continue
             
-            for value in domain.values[:]:
-                other_room, other_day, other_slots = value
-                
-                # Check if this value would violate constraints
-                # Room conflict
-                if other_room == room and other_day == day:
-                    if self._slots_overlap(time_slots, other_slots):
-                        values_to_remove.append(value)
-                        continue
-                
-                # Class conflict
-                if other_var.class_name == var.class_name and other_day == day:
-                    if self._slots_overlap(time_slots, other_slots):
-                        values_to_remove.append(value)
-                        continue
-                
-                # Instructor conflict
-                if (var.instructor and other_var.instructor == var.instructor and 
-                    other_day == day):
-                    if self._slots_overlap(time_slots, other_slots):
-                        values_to_remove.append(value)
-                        continue
+            # Class and instructor conflicts remove every overlapping value;
+            # otherwise only values in the same room clash
+            if (other_var.class_name == var.class_name or
+                    (var.instructor and other_var.instructor == var.instructor)):
+                pruned = overlap
+            else:
+                pruned = overlap & table.room_day_masks.get((room, day), 0)
+            
+            if pruned:
+                domain.mask ^= pruned
+                trail.append((other_var.id, pruned))
+                if reasons is not None:
+                    reasons[other_var.id].append(self._reason_exact)
+                if heap is not None:
+                    heapq.heappush(heap, (self._var_priority(other_var.id), other_var.id))
+                if not domain.mask:
+                    return False
+        
+        if self.options["propagation"] == "mac":
+            return self.propagate([var_id for var_id, _ in trail[start:]], initial=False)
+        return True
+    
+    # ==================== ARC CONSISTENCY ====================
+    
+    def establish_arc_consistency(self) -> bool:
+        """AC-3 over every unassigned variable; False if a domain is wiped out."""
+        return self.propagate([v.id for v in self.variables if v.assignment is None], initial=True)
+    
+    def propagate(self, changed: List[int], initial: bool) -> bool:
+        """Restore arc consistency after the domains in changed shrank.
+        
+        Variable-queue AC-3 over the binary hard constraints: a variable's
+        tight neighbours (same class or instructor) may not overlap it at
+        all, everyone else only in the same room. Only arcs that can prune
+        are revised: a tight arc needs the supporting domain confined to a
+        single day (otherwise every value has a support on another day),
+        and a room arc needs it confined to a single (room, day), so only
+        then are the variables with values in that room and day scanned.
+        Prunes go on the trail.
+        """
+        variables = self.variables
+        domains = self.domains
+        pending = deque(dict.fromkeys(changed))
+        queued = set(pending)
+        pruned_values = 0
+        consistent = True
+        
+        while pending and consistent:
+            y_id = pending.popleft()
+            queued.discard(y_id)
+            if variables[y_id].assignment is not None or not domains[y_id].mask:
+                continue
+            room, day = self._confinement(domains[y_id])
+            if day is None:
+                continue
+            tight = self.tight_neighbours[y_id]
+            if room is None:
+                candidates = iter(tight)
+            else:
+                candidates = (v.id for v in variables if v.id != y_id and (
+                    v.id in tight or domains[v.id].mask & domains[v.id].table.room_day_masks.get((room, day), 0)))
             
-            # Remove conflicting values and track for restoration
-            for value in values_to_remove:
-                domain.remove(value)
-                removed_values[other_var.id].append(value)
+            for x_id in candidates:
+                if variables[x_id].assignment is not None:
+                    continue
+                removed = self._revise(x_id, y_id, x_id in tight)
+                if not removed:
+                    continue
+                pruned_values += bin(removed).count("1")
+                if not domains[x_id].mask:
+                    consistent = False
+                    break
+                if x_id not in queued:
+                    queued.add(x_id)
+                    pending.append(x_id)
+        
+        if initial:
+            self.arc_pruned_initial += pruned_values
+        else:
+            self.arc_pruned_search += pruned_values
+        return consistent
+    
+    def _revise(self, x_id: int, y_id: int, tight: bool) -> int:
+        """Prune values of x with no support in y's domain; returns the pruned mask.
+        
+        Conflicts are symmetric, so the unsupported values of x are those in
+        the conflict set of every value of y. The intersection usually
+        empties after a value or two, which ends the scan.
+        """
+        self.arc_revisions += 1
+        x_domain = self.domains[x_id]
+        y_domain = self.domains[y_id]
+        x_table = x_domain.table
+        y_values = y_domain.table.values
+        unsupported = x_domain.mask
+        remaining = y_domain.mask
+        
+        while remaining and unsupported:
+            low = remaining & -remaining
+            remaining ^= low
+            room, day, time_slots = y_values[low.bit_length() - 1]
+            conflict = x_table.overlap_mask(day, time_slots)
+            if not tight:
+                conflict &= x_table.room_day_masks.get((room, day), 0)
+            unsupported &= conflict
+        
+        if unsupported:
+            x_domain.mask ^= unsupported
+            self.trail.append((x_id, unsupported))
+            if self.prune_reasons is not None:
+                self.prune_reasons[x_id].append(self._reason_upto)
+            self._requeue(x_id)
+        return unsupported
+    
+    @staticmethod
+    def _confinement(domain: CSPDomain) -> Tuple[Optional[str], Optional[str]]:
+        """(room, day) shared by every remaining value of domain, None for either that varies.
         
-        return removed_values
+        The room is only reported when the day is shared too.
+        """
+        mask = domain.mask
+        if not mask:
+            return None, None
+        table = domain.table
+        room, day, _ = table.values[(mask & -mask).bit_length() - 1]
+        if mask & ~table.day_masks[day]:
+            return None, None
+        if mask & ~table.room_day_masks[(room, day)]:
+            return None, day
+        return room, day
+    
+    # ==================== ASSIGNMENT BOOKKEEPING ====================
+    
+    def assign(self, var: CSPVariable, value: Tuple):
+        """Assign value to var and record it in the occupancy indexes."""
+        room, day, time_slots = value
+        var.assignment = value
+        self.room_occupancy[(room, day)][var.id] = time_slots
+        self.class_occupancy[(var.class_name, day)][var.id] = time_slots
+        if var.instructor:
+            self.instructor_occupancy[(var.instructor, day)][var.id] = time_slots
+        self.course_day_occupancy[(var.class_name, var.course, day)][var.id] = time_slots
+        intervals = self.class_day_intervals[(var.class_name, day)]
+        for slot in time_slots:
+            bisect.insort(intervals, slot)
+    
+    def unassign(self, var: CSPVariable):
+        """Clear var's assignment and drop it from the occupancy indexes."""
+        if var.assignment is None:
+            return
+        room, day, time_slots = var.assignment
+        self.room_occupancy[(room, day)].pop(var.id, None)
+        self.class_occupancy[(var.class_name, day)].pop(var.id, None)
+        if var.instructor:
+            self.instructor_occupancy[(var.instructor, day)].pop(var.id, None)
+        self.course_day_occupancy[(var.class_name, var.course, day)].pop(var.id, None)
+        intervals = self.class_day_intervals[(var.class_name, day)]
+        for slot in time_slots:
+            del intervals[bisect.bisect_left(intervals, slot)]
+        var.assignment = None
+        self._requeue(var.id)
     
-    def restore_domains(self, removed_values: Dict[int, List]):
-        """Restore domain values after backtracking."""
-        for var_id, values in removed_values.items():
-            for value in values:
-                self.domains[var_id].add(*value)
+    def undo_to(self, mark: int):
+        """Rewind the trail to mark, restoring pruned values and assignments."""
+        trail = self.trail
+        domains = self.domains
+        while len(trail) > mark:
+            var_id, pruned = trail.pop()
+            if pruned:
+                domains[var_id].mask |= pruned
+                if self.prune_reasons is not None:
+                    self.prune_reasons[var_id].pop()
+            else:
+                self.unassign(self.variables[var_id])
     
     # ==================== BACKTRACKING SEARCH ====================
     
     def _time_exceeded(self) -> bool:
-        import time
-        return (time.time() - self._start_time) > self.max_seconds
+        now = time.time()
+        return self._poll(now) or (now - self._start_time) > self.max_seconds
+    
+    def _poll(self, now: float) -> bool:
+        """Run the progress and should_stop hooks when due; True once stopped."""
+        if now >= self._next_poll:
+            self._next_poll = now + self.progress_interval
+            if self.progress is not None:
+                self.progress(self.progress_snapshot())
+            if self.should_stop is not None and self.should_stop():
+                self.stopped = True
+        return self.stopped
+    
+    def progress_snapshot(self) -> Dict[str, Any]:
+        return {
+            "variablesAssigned": sum(1 for v in self.variables if v.assignment is not None),
+            "totalVariables": len(self.variables),
+            "backtracks": self.backtracks,
+            "constraintsChecked": self.constraints_checked,
+            "elapsed": round(time.time() - self._start_time, 3),
+        }
 
-    def backtrack(self) -> bool:
-        """Backtracking search with forward checking."""
-        # Abort if time budget exceeded to avoid hanging
-        if self._time_exceeded():
-            return False
-        # Check if assignment is complete
-        var = self.select_unassigned_variable()
-        if var is None:
-            return True  # All variables assigned
+    def exclude_from_siblings(self, var: CSPVariable, value: Tuple):
+        """Remove a refuted value from the unassigned siblings of var.
         
-        # Check if domain is empty
-        if self.domains[var.id].is_empty():
-            return False
+        Siblings are interchangeable, so once var = value has been refuted
+        under the current partial assignment, a sibling taking value would
+        only reach a permutation of that failed subtree. The prunes go on
+        the trail and are undone together with the parent's choice.
+        """
+        for sibling_id in self.sibling_groups.get(var.id, ()):
+            if sibling_id == var.id or self.variables[sibling_id].assignment is not None:
+                continue
+            domain = self.domains[sibling_id]
+            idx = domain.table.index.get(value)
+            if idx is not None and domain.mask >> idx & 1:
+                domain.mask ^= 1 << idx
+                self.trail.append((sibling_id, 1 << idx))
+                if self.prune_reasons is not None:
+                    # The refutation holds for the assignments above var
+                    self.prune_reasons[sibling_id].append(self._reason_upto ^ self._reason_exact)
+                self._requeue(sibling_id)
+    
+    def backtrack(self) -> bool:
+        """Backtracking search with forward checking.
         
-        # Try values in order
-        ordered_values = self.order_domain_values(var)
+        Runs on an explicit stack of SearchFrames instead of recursing once
+        per variable, so search depth is not bounded by Python's recursion
+        limit. On timeout every assignment made here is undone.
         
-        for value in ordered_values:
-            # Make assignment
-            var.assignment = value
-            
-            # Forward check
-            removed = self.forward_check(var, value)
-            
-            # Check if any domain became empty
-            domains_valid = all(
-                not self.domains[v.id].is_empty() 
-                for v in self.variables 
-                if v.assignment is None
-            )
+        With the backjumping option a dead end jumps straight back to the
+        deepest assignment in its conflict set (FC-CBJ) instead of the
+        previous one, and the conflict set is merged into that frame's.
+        """
+        base_mark = len(self.trail)
+        stack: List[SearchFrame] = []
+        backjumping = self.options["backjumping"]
+        self._assigned_at_start = sum(1 for v in self.variables if v.assignment is not None)
+        
+        while True:
+            # Abort if time budget exceeded to avoid hanging
+            if self._time_exceeded():
+                self.timed_out = True
+                self.cut_short = True
+                self._note_partial(len(stack))
+                self.undo_to(base_mark)
+                return False
+            # Check if assignment is complete
+            var = self.select_unassigned_variable()
+            if var is None:
+                return True  # All variables assigned
             
-            if domains_valid:
-                # Recursive call
-                result = self.backtrack()
-                if result:
-                    return True
+            # Empty domain gets no values, so the frame fails immediately
+            if self.domains[var.id].is_empty():
+                ordered_values = []
+            else:
+                ordered_values = self.order_domain_values(var)
+                previous = self.preferred.get(var.id)
+                if previous is not None and previous in ordered_values:
+                    # Keep the session where it was when that is still possible
+                    ordered_values.remove(previous)
+                    ordered_values.insert(0, previous)
+            stack.append(SearchFrame(var, ordered_values, len(self.trail)))
+            if backjumping:
+                self._var_depth[var.id] = len(stack) - 1
             
-            # Backtrack
-            self.backtracks += 1
-            var.assignment = None
-            self.restore_domains(removed)
-        
-        return False
-    
+            # Advance to the next value that survives forward checking,
+            # popping exhausted frames on the way up
+            while True:
+                frame = stack[-1]
+                if frame.next_index < len(frame.values):
+                    value = frame.values[frame.next_index]
+                    frame.next_index += 1
+                    
+                    if backjumping:
+                        self._set_reason_depth(len(stack) - 1)
+                        culprits = self._violated_nogood(frame.var, value)
+                        if culprits is not None:
+                            self.nogood_hits += 1
+                            self.backtracks += 1
+                            frame.conflicts |= culprits
+                            continue
+                    
+                    # Make assignment
+                    self.assign(frame.var, value)
+                    self.trail.append((frame.var.id, 0))
+                    
+                    # Forward check; fails early if any domain became empty
+                    if self.forward_check(frame.var, value):
+                        break  # descend to the next variable
+                    
+                    self.backtracks += 1
+                    if self.options["variable_order"] == "dom/wdeg":
+                        self._bump_weight(frame.var.id, self.trail[-1][0])
+                    if backjumping:
+                        # Blame whatever emptied the wiped-out domain
+                        frame.conflicts |= self._domain_reasons(self.variables[self.trail[-1][0]])
+                    self.undo_to(frame.mark)
+                    if self.sibling_groups:
+                        self.exclude_from_siblings(frame.var, value)
+                        frame.mark = len(self.trail)
+                elif backjumping:
+                    depth = len(stack) - 1
+                    self._note_partial(depth)
+                    # Values never tried were pruned from above; blame those too
+                    conflicts = (frame.conflicts | self._domain_reasons(frame.var)) & ((1 << depth) - 1)
+                    if not conflicts:
+                        self.undo_to(base_mark)
+                        return False
+                    target = conflicts.bit_length() - 1
+                    self._learn_nogood(stack, conflicts)
+                    self.backjumps += 1
+                    self.levels_skipped += depth - 1 - target
+                    self.backtracks += 1
+                    del stack[target + 1:]
+                    parent = stack[-1]
+                    parent.conflicts |= conflicts ^ (1 << target)
+                    self.undo_to(parent.mark)
+                    if self.sibling_groups:
+                        self._set_reason_depth(target)
+                        self.exclude_from_siblings(parent.var, parent.values[parent.next_index - 1])
+                        parent.mark = len(self.trail)
+                else:
+                    stack.pop()
+                    self._note_partial(len(stack))
+                    if not stack:
+                        return False
+                    # The parent's current value led to a dead end
+                    self.backtracks += 1
+                    parent = stack[-1]
+                    self.undo_to(parent.mark)
+                    if self.sibling_groups:
+                        self.exclude_from_siblings(parent.var, parent.values[parent.next_index - 1])
+                        parent.mark = len(self.trail)
+    
+    def _note_partial(self, assigned: int):
+        """Snapshot the assignment if it is the deepest dead end so far.
+        
+        Called before undoing, when the assigned variables are exactly
+        those of the frames below the failing one plus any pinned before
+        the search.
+        """
+        assigned += self._assigned_at_start
+        if assigned > self._best_partial_count:
+            self._best_partial_count = assigned
+            self.best_partial = [var.assignment for var in self.variables]
+    
+    # ==================== BACKJUMPING ====================
+    
+    def _set_reason_depth(self, depth: int):
+        """Attribute the prunes that follow to the assignment at depth."""
+        self._reason_exact = 1 << depth
+        self._reason_upto = (1 << (depth + 1)) - 1
+    
+    def _domain_reasons(self, var: CSPVariable) -> int:
+        """Stack depths responsible for every value missing from var's domain."""
+        conflicts = 0
+        for reason in self.prune_reasons[var.id]:
+            conflicts |= reason
+        return conflicts
+    
+    def _violated_nogood(self, var: CSPVariable, value: Tuple) -> Optional[int]:
+        """Depths of the assignments completing a learned nogood with var = value."""
+        variables = self.variables
+        for nogood in self.nogoods.get((var.id, value), ()):
+            culprits = 0
+            for other_id, other_value in nogood:
+                if other_id == var.id:
+                    continue
+                if variables[other_id].assignment != other_value:
+                    break
+                culprits |= 1 << self._var_depth[other_id]
+            else:
+                return culprits
+        return None
+    
+    def _learn_nogood(self, stack: List[SearchFrame], conflicts: int):
+        """Remember that the assignments at the conflicting depths cannot coexist."""
+        if not self.options["nogoods"] or self.nogoods_learned >= MAX_NOGOODS:
+            return
+        if bin(conflicts).count("1") > MAX_NOGOOD_SIZE:
+            return
+        nogood = []
+        while conflicts:
+            low = conflicts & -conflicts
+            conflicts ^= low
+            var = stack[low.bit_length() - 1].var
+            nogood.append((var.id, var.assignment))
+        nogood = tuple(nogood)
+        for literal in nogood:
+            self.nogoods[literal].append(nogood)
+        self.nogoods_learned += 1
+    
     def solve(self) -> bool:
         """Solve the CSP."""
-        return self.backtrack()
+        started = time.time()
+        try:
+            if self.options["propagation"] != "forward" and not self.establish_arc_consistency():
+                return False
+            self._root_masks = {var_id: domain.mask for var_id, domain in self.domains.items()}
+            if not self.backtrack():
+                return False
+            self._first_solution_seconds = time.time() - started
+            # The selection heap is rebuilt on demand; don't let moves grow it
+            self._var_heap = None
+            if self.options["local_search"]:
+                self.improve(self.payload.localSearchIterations
+                             or LOCAL_SEARCH_STEPS[self.options["local_search"]],
+                             self.payload.localSearchSeconds)
+            return True
+        finally:
+            self._solve_seconds = time.time() - started
+    
+    def total_soft_score(self) -> float:
+        """Soft score of the current assignment.
+        
+        Each placed session is scored as if it were placed last, against all
+        other placed sessions.
+        """
+        total = 0.0
+        for var in self.variables:
+            if var.assignment is not None:
+                total += self._placed_score(var)
+        return total
+    
+    def _placed_score(self, var: CSPVariable) -> float:
+        """Soft score of var's current placement, scored as if placed last."""
+        value = var.assignment
+        self.unassign(var)
+        score = self.calculate_soft_constraint_score(var, value)
+        self.assign(var, value)
+        return score
+    
+    # ==================== LOCAL SEARCH ====================
+    
+    def improve(self, steps: int, max_seconds: float):
+        """Lower the soft score of a complete assignment by local search.
+        
+        Each step picks a session that carries a penalty, in proportion to
+        it, and moves it: to a placement that is free right now, or by
+        swapping with another session of its class; moves breaking a hard
+        constraint are rejected. Each move is scored by delta, re-scoring
+        only the sessions sharing a class or instructor day with it.
+        Simulated annealing tries one random move per step and accepts a
+        worse one with a cooling probability. Tabu search scans the
+        session's TABU_SAMPLE best-looking re-placements and every swap,
+        and takes the best move not undoing a recent one, unless that move
+        beats the best score. The best timetable seen is restored at the end.
+        
+        The search runs for steps steps, with annealing cooled by step
+        count, so the outcome depends only on the seed. max_seconds (or
+        should_stop) aborts it early and sets cut_short.
+        """
+        anneal = self.options["local_search"] == "anneal"
+        rng = self.rng
+        by_class: Dict[str, List[CSPVariable]] = defaultdict(list)
+        for var in self.variables:
+            by_class[var.class_name].append(var)
+        tabu: Dict[Tuple[int, Tuple], int] = {}
+        
+        # Placed score per session, kept current as moves are made
+        scores = {var.id: self._placed_score(var) for var in self.variables}
+        current = self.soft_score_before = sum(scores.values())
+        best = current
+        best_values = [var.assignment for var in self.variables]
+        deadline = time.time() + max_seconds
+        iteration = 0
+        
+        while iteration < steps:
+            now = time.time()
+            if now >= deadline or self._poll(now):
+                self.cut_short = True
+                break
+            if anneal:
+                temperature = ANNEAL_START_TEMPERATURE * (
+                    ANNEAL_END_TEMPERATURE / ANNEAL_START_TEMPERATURE) ** (iteration / steps)
+            var = self._penalised_session(scores)
+            if var is None:
+                break  # nothing left to improve
+            iteration += 1
+            
+            if anneal:
+                move = self._random_move(var, by_class)
+                applied = self._apply_move(move) if move else None
+                if applied is None:
+                    continue
+                delta, previous = applied
+                if delta > 0 and rng.random() >= math.exp(-delta / temperature):
+                    self._revert_move(previous)
+                    continue
+            else:
+                move, delta = None, None
+                for candidate in self._neighbourhood_moves(var, by_class):
+                    applied = self._apply_move(candidate)
+                    if applied is None:
+                        continue
+                    candidate_delta, previous = applied
+                    self._revert_move(previous)
+                    forbidden = any(tabu.get((moved.id, value), 0) > iteration for moved, value in candidate)
+                    if forbidden and current + candidate_delta >= best - 1e-9:
+                        continue
+                    if delta is None or candidate_delta < delta:
+                        move, delta = candidate, candidate_delta
+                if move is None:
+                    continue
+                for moved, _ in move:
+                    tabu[(moved.id, moved.assignment)] = iteration + TABU_TENURE
+                _, previous = self._apply_move(move)
+            
+            self.local_search_moves += 1
+            current += delta
+            for affected in self._move_neighbourhood(previous):
+                scores[affected.id] = self._placed_score(affected)
+            if current < best - 1e-9:
+                best = current
+                best_values = [var.assignment for var in self.variables]
+        
+        self.local_search_iterations = iteration
+        changed = [var for var, value in zip(self.variables, best_values) if var.assignment != value]
+        for var in changed:
+            self.unassign(var)
+        for var in changed:
+            self.assign(var, best_values[var.id])
+    
+    def _penalised_session(self, scores: Dict[int, float]) -> Optional[CSPVariable]:
+        """Draw a session with a non-zero placed score, weighted by that score."""
+        ids = [var_id for var_id, score in scores.items() if score > 1e-9]
+        if not ids:
+            return None
+        return self.variables[self.rng.choices(ids, weights=[scores[var_id] for var_id in ids])[0]]
+    
+    def _free_values(self, var: CSPVariable) -> int:
+        """Mask of var's root-domain values clashing with no other current placement."""
+        table = self.domains[var.id].table
+        mask = self._root_masks[var.id] & ~self._conflict_mask(var, table)
+        idx = table.index.get(var.assignment)
+        return mask & ~(1 << idx) if idx is not None else mask
+    
+    def _swaps(self, var: CSPVariable, by_class: Dict[str, List[CSPVariable]]
+               ) -> List[List[Tuple[CSPVariable, Tuple]]]:
+        """Swaps of var's placement with each class-mate at another time that both domains allow."""
+        swaps = []
+        for other in by_class[var.class_name]:
+            if other is var or other.assignment[1:] == var.assignment[1:]:
+                continue
+            move = [(var, other.assignment), (other, var.assignment)]
+            if all(self._in_root_domain(moved, value) for moved, value in move):
+                swaps.append(move)
+        return swaps
+    
+    def _in_root_domain(self, var: CSPVariable, value: Tuple) -> bool:
+        idx = self.domains[var.id].table.index.get(value)
+        return idx is not None and bool(self._root_masks[var.id] >> idx & 1)
+    
+    def _random_move(self, var: CSPVariable, by_class: Dict[str, List[CSPVariable]]
+                     ) -> Optional[List[Tuple[CSPVariable, Tuple]]]:
+        """Draw a re-placement of var into a free value, or a swap, as [(var, new_value), ...]."""
+        rng = self.rng
+        if rng.random() < 0.5:
+            other = rng.choice(by_class[var.class_name])
+            if other is var or other.assignment[1:] == var.assignment[1:]:
+                return None
+            move = [(var, other.assignment), (other, var.assignment)]
+            if not all(self._in_root_domain(moved, value) for moved, value in move):
+                return None
+            return move
+        
+        free = self._free_values(var)
+        if not free:
+            return None
+        indexes = [i for i in range(free.bit_length()) if free >> i & 1]
+        return [(var, self.domains[var.id].table.values[rng.choice(indexes)])]
+    
+    def _neighbourhood_moves(self, var: CSPVariable, by_class: Dict[str, List[CSPVariable]]
+                             ) -> List[List[Tuple[CSPVariable, Tuple]]]:
+        """Tabu search's moves for var: its best re-placements by own score, then its swaps.
+        
+        Free values are grouped by day and time with the best-suited room
+        kept for each; the TABU_SAMPLE lowest scoring as if var were placed
+        last are returned, ties in table order.
+        """
+        free = self._free_values(var)
+        table = self.domains[var.id].table
+        by_time: Dict[Tuple[str, tuple], Tuple] = {}
+        while free:
+            low = free & -free
+            free ^= low
+            value = table.values[low.bit_length() - 1]
+            key = (value[1], value[2])
+            kept = by_time.get(key)
+            if kept is None or (self._penalty_room_type_mismatch(var.session_type, value[0]) <
+                                self._penalty_room_type_mismatch(var.session_type, kept[0])):
+                by_time[key] = value
+        
+        current = var.assignment
+        self.unassign(var)
+        scored = sorted(by_time.values(), key=lambda value: self.calculate_soft_constraint_score(var, value))
+        self.assign(var, current)
+        return [[(var, value)] for value in scored[:TABU_SAMPLE]] + self._swaps(var, by_class)
+    
+    def _apply_move(self, move: List[Tuple[CSPVariable, Tuple]]
+                    ) -> Optional[Tuple[float, List[Tuple[CSPVariable, Tuple]]]]:
+        """Apply move, returning the soft-score delta and the placements it replaced.
+        
+        Returns None, with nothing changed, if the move breaks a hard constraint.
+        """
+        affected = self._move_neighbourhood(move)
+        before = sum(self._placed_score(var) for var in affected)
+        previous = [(var, var.assignment) for var, _ in move]
+        for var, _ in move:
+            self.unassign(var)
+        placed = []
+        for var, value in move:
+            if not self.check_hard_constraints(var, value):
+                for done in placed:
+                    self.unassign(done)
+                for old_var, old_value in previous:
+                    self.assign(old_var, old_value)
+                return None
+            self.assign(var, value)
+            placed.append(var)
+        return sum(self._placed_score(var) for var in affected) - before, previous
+    
+    def _revert_move(self, previous: List[Tuple[CSPVariable, Tuple]]):
+        """Put back the placements returned by _apply_move."""
+        for var, _ in previous:
+            self.unassign(var)
+        for var, value in previous:
+            self.assign(var, value)
+    
+    def _move_neighbourhood(self, move: List[Tuple[CSPVariable, Tuple]]) -> List[CSPVariable]:
+        """Sessions whose placed score a move can change, in id order."""
+        ids: Set[int] = set()
+        for var, value in move:
+            ids.add(var.id)
+            for day in (var.assignment[1], value[1]):
+                ids.update(self.class_occupancy.get((var.class_name, day), ()))
+                if var.instructor:
+                    ids.update(self.instructor_occupancy.get((var.instructor, day), ()))
+        return [self.variables[var_id] for var_id in sorted(ids)]
+    
+    def settle(self) -> int:
+        """Greedy, deterministic descent over a complete assignment; returns the moves made.
+        
+        Sessions are visited in id order. For each, the lowest-scoring day
+        and time with a free room in its root domain is re-scored like an
+        improve() move and taken if it lowers the total. Sweeps repeat
+        until one makes no move or the time limit is reached, which is
+        checked before every session since one sweep of a large institute
+        can take longer than what is left of the limit.
+        """
+        by_time_cache: Dict[Tuple[int, int], List[Tuple[Tuple[str, tuple], List[Tuple]]]] = {}
+        moves = 0
+        while True:
+            swept = 0
+            for var in self.variables:
+                if self._time_exceeded():
+                    self.cut_short = True
+                    return moves + swept
+                current = var.assignment
+                domain = self.domains[var.id]
+                key = (id(domain.table), self._root_masks.get(var.id, domain.mask))
+                by_time = by_time_cache.get(key)
+                if by_time is None:
+                    grouped: Dict[Tuple[str, tuple], List[Tuple]] = defaultdict(list)
+                    for value in self._root_values(var):
+                        grouped[(value[1], value[2])].append(value)
+                    by_time = by_time_cache[key] = list(grouped.items())
+                
+                self.unassign(var)
+                best, best_score = None, None
+                for (day, time_slots), values in by_time:
+                    if not self._check_no_class_conflict(var.class_name, day, time_slots, var):
+                        continue
+                    if var.instructor and not self._check_no_instructor_conflict(
+                            var.instructor, day, time_slots, var):
+                        continue
+                    room = next((value for value in values
+                                 if self._check_no_room_conflict(value[0], day, time_slots, var)), None)
+                    if room is not None:
+                        score = self.calculate_soft_constraint_score(var, room)
+                        if best_score is None or score < best_score:
+                            best, best_score = room, score
+                self.assign(var, current)
+                
+                if best is None or best[1:] == current[1:]:
+                    continue
+                applied = self._apply_move([(var, best)])
+                if applied is None:
+                    continue
+                delta, previous = applied
+                if delta < -1e-9:
+                    swept += 1
+                else:
+                    self._revert_move(previous)
+            moves += swept
+            if not swept:
+                break
+        return moves
+    
+    # ==================== REPAIR ====================
+    
+    def values_from_details(self, details: List[Dict[str, Any]]) -> Tuple[Dict[int, Tuple], int]:
+        """Map get_solution detail rows back onto this solver's variables.
+        
+        Rows of a (class, course) sharing a day and room form one lab
+        session when the course has labs left, otherwise one lecture per
+        row; sessions of a course are interchangeable, so they are handed
+        out in order. Returns var_id -> value and the number of sessions
+        with no variable left to take them. Values are not checked against
+        the domains. Raises ValueError naming the first malformed row.
+        """
+        rows: Dict[Tuple[str, str], Dict[Tuple[str, str], List[Tuple[int, int]]]] = defaultdict(lambda: defaultdict(list))
+        for number, row in enumerate(details):
+            try:
+                start, end = (to_minutes(t.strip()) for t in str(row["time"]).split("-"))
+                key = (str(row["class"]), str(row["course"]))
+                place = (str(row["day"]), str(row["roomNumber"]))
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f"details[{number}] is not a timetable row: it needs class, course, "
+                                 f"day, roomNumber and time as \"HH:MM-HH:MM\"") from None
+            if start >= end:
+                raise ValueError(f"details[{number}] has a time that does not end after it starts")
+            rows[key][place].append((start, end))
+        
+        by_course: Dict[Tuple[str, str], List[CSPVariable]] = defaultdict(list)
+        for var in self.variables:
+            by_course[(var.class_name, var.course)].append(var)
+        
+        values: Dict[int, Tuple] = {}
+        unmatched = 0
+        for key, groups in rows.items():
+            labs = [v for v in by_course.get(key, ()) if v.session_type == "Lab"]
+            lectures = [v for v in by_course.get(key, ()) if v.session_type == "Lecture"]
+            for (day, room), slots in sorted(groups.items()):
+                slots.sort()
+                if labs and len(slots) > 1:
+                    values[labs.pop(0).id] = (room, day, tuple(slots))
+                    continue
+                for slot in slots:
+                    if lectures:
+                        values[lectures.pop(0).id] = (room, day, (slot,))
+                    else:
+                        unmatched += 1
+        return values, unmatched
+    
+    def in_domain(self, var: CSPVariable, value: Tuple) -> bool:
+        """True if value is still one of var's initial placements."""
+        domain = self.domains[var.id]
+        idx = domain.table.index.get(value)
+        return idx is not None and bool(domain.mask >> idx & 1)
+    
+    def pin(self, values: Dict[int, Tuple]) -> Tuple[bool, List[int]]:
+        """Fix variables to values before search, in id order.
+        
+        Values that clash with an earlier pin are skipped. The free
+        variables are then forward checked against every pin; returns
+        False if one of them is left without values, plus the skipped ids.
+        Everything goes on the trail, so undo_to(0) releases the pins.
+        """
+        skipped = []
+        pinned = []
+        for var_id in sorted(values):
+            var = self.variables[var_id]
+            if not self.check_hard_constraints(var, values[var_id]):
+                skipped.append(var_id)
+                continue
+            self.assign(var, values[var_id])
+            self.trail.append((var_id, 0))
+            pinned.append(var)
+        
+        free = [var for var in self.variables if var.assignment is None]
+        for var in pinned:
+            if not self.forward_check(var, var.assignment, targets=free):
+                return False, skipped
+        return True, skipped
+    
+    def solve_around(self, values: Dict[int, Tuple]) -> Tuple[bool, Set[int], int]:
+        """Solve with values (var_id -> in-domain value) pinned, freeing pins until it works.
+        
+        Variables without a value are solved around the pins first. If that
+        fails the free set grows to the sessions sharing a class or
+        instructor with it, then once more, and finally to everything.
+        Freed sessions try their old value first, so each round still moves
+        as little as it can. Returns whether a round succeeded, the final
+        free set and the number of rounds; after a failure only the best
+        partial snapshot is left for get_partial_solution.
+        """
+        self.preferred = values
+        free = {var.id for var in self.variables if var.id not in values}
+        rounds = 0
+        while True:
+            rounds += 1
+            self.undo_to(0)
+            pinned, skipped = self.pin({i: v for i, v in values.items() if i not in free})
+            free.update(skipped)
+            if pinned and self.solve():
+                return True, free, rounds
+            if len(free) == len(self.variables) or self.timed_out or self.stopped:
+                break
+            if rounds < 3:
+                free = self.neighbourhood(free)
+            else:
+                free = {var.id for var in self.variables}
+        # The deepest snapshot may come from an earlier round's pins
+        self.undo_to(0)
+        return False, free, rounds
+    
+    def neighbourhood(self, var_ids: Set[int]) -> Set[int]:
+        """var_ids plus every variable sharing a class or instructor with one of them."""
+        classes = {self.variables[i].class_name for i in var_ids}
+        instructors = {self.variables[i].instructor for i in var_ids} - {None}
+        return var_ids | {var.id for var in self.variables
+                          if var.class_name in classes or var.instructor in instructors}
+    
+    def get_partial_solution(self) -> Dict[str, Any]:
+        """Deepest partial timetable after a failed solve, as a degraded candidate.
+        
+        The deepest dead end is restored and then extended greedily, so the
+        sessions left over are those that clash everywhere. Same shape as
+        get_solution, plus "unplaced" listing each of them and why.
+        """
+        if self.best_partial is not None:
+            for var, value in zip(self.variables, self.best_partial):
+                if value is not None and var.assignment is None:
+                    self.assign(var, value)
+        self._fill_partial()
+        
+        solution = self.get_solution()
+        unplaced = [self._unplaced_reason(var) for var in self.variables if var.assignment is None]
+        solution["unplaced"] = unplaced
+        solution["stats"]["partial"] = True
+        solution["stats"]["unplacedCount"] = len(unplaced)
+        solution["stats"]["timedOut"] = self.timed_out
+        return solution
+    
+    def _root_mask(self, var: CSPVariable) -> int:
+        """var's domain mask as it was when search started."""
+        return self._root_masks.get(var.id, self.domains[var.id].mask)
+    
+    def _root_values(self, var: CSPVariable) -> List[Tuple]:
+        """Values of var's domain as it was when search started."""
+        values = self.domains[var.id].table.values
+        mask = self._root_mask(var)
+        out = []
+        # Walk the set bits only; the table holds every value of the template
+        while mask:
+            low = mask & -mask
+            out.append(values[low.bit_length() - 1])
+            mask ^= low
+        return out
+    
+    def _fill_partial(self):
+        """Place whatever unassigned sessions still fit, fewest options first.
+        
+        Each goes to its lowest soft-score placement that passes the hard
+        constraints, like the first step of LCV. Stops at the solver's time
+        limit, so after a timeout only the deepest snapshot is returned.
+        """
+        pending = [var for var in self.variables if var.assignment is None]
+        pending.sort(key=lambda var: (self._root_mask(var).bit_count(), var.id))
+        for var in pending:
+            if self._time_exceeded():
+                self.cut_short = True
+                return
+            table = self.domains[var.id].table
+            mask = self._root_mask(var) & ~self._conflict_mask(var, table)
+            best, best_score = None, None
+            slot_scores: Dict[Tuple[str, tuple], float] = {}
+            while mask:
+                low = mask & -mask
+                mask ^= low
+                value = table.values[low.bit_length() - 1]
+                room, day, time_slots = value
+                slot_score = slot_scores.get((day, time_slots))
+                if slot_score is None:
+                    slot_score = slot_scores[(day, time_slots)] = self._slot_soft_score(var, day, time_slots)
+                # Same sum as calculate_soft_constraint_score
+                score = slot_score + self._penalty_room_type_mismatch(var.session_type, room) * 3
+                if best_score is None or score < best_score:
+                    best, best_score = value, score
+            if best is not None:
+                self.assign(var, best)
+    
+    def _unplaced_reason(self, var: CSPVariable) -> Dict[str, Any]:
+        """Explain why var has no placement next to the current partial assignment."""
+        root = self._root_mask(var)
+        room_mask, class_mask, instructor_mask = self._conflict_masks(var, self.domains[var.id].table)
+        blocked = {"room": (root & room_mask).bit_count(),
+                   "class": (root & class_mask).bit_count(),
+                   "instructor": (root & instructor_mask).bit_count()}
+        
+        if not root:
+            reason = ("No room and time combination fits this session; check lab blocks, "
+                      "breaks, time windows and room types.")
+        else:
+            clashes = [f"{key} busy in {count}" for key, count in
+                       (("class", blocked["class"]), ("instructor", blocked["instructor"]),
+                        ("room", blocked["room"])) if count]
+            reason = f"All {root.bit_count()} placements clash: " + ", ".join(clashes) + "."
+        
+        return {
+            "class": var.class_name,
+            "course": var.course,
+            "type": var.session_type,
+            "instructor": var.instructor,
+            "reason": reason,
+            "blockedBy": blocked,
+        }
     
     def get_solution(self) -> Dict[str, Any]:
         """Convert CSP solution to timetable format."""
@@ -846,7 +2488,7 @@ class CSPSolver:
                     "class": var.class_name,
                     "course": var.course,
                     "day": day,
-                    "time": f"{start}-{end}",
+                    "time": f"{from_minutes(start)}-{from_minutes(end)}",
                     "instructorName": var.instructor or "Instructor",
                 })
         
@@ -873,12 +2515,52 @@ class CSPSolver:
             "stats": {
                 "constraintsChecked": self.constraints_checked,
                 "backtracks": self.backtracks,
-                "variablesAssigned": len([v for v in self.variables if v.assignment])
+                "variablesAssigned": len([v for v in self.variables if v.assignment]),
+                "softScore": round(self.total_soft_score(), 2),
+                "strategy": self.strategy,
+                "seed": self.seed,
+                "propagation": self.options["propagation"],
+                "arcRevisions": self.arc_revisions,
+                "arcPrunedInitial": self.arc_pruned_initial,
+                "arcPrunedSearch": self.arc_pruned_search,
+                "backjumps": self.backjumps,
+                "levelsSkipped": self.levels_skipped,
+                "nogoodsLearned": self.nogoods_learned,
+                "nogoodHits": self.nogood_hits,
+                "solveSeconds": round(self._solve_seconds, 3),
+                "firstSolutionSeconds": (round(self._first_solution_seconds, 3)
+                                         if self._first_solution_seconds is not None else None),
+                "localSearch": self.options["local_search"],
+                "softScoreBefore": (round(self.soft_score_before, 2)
+                                    if self.soft_score_before is not None else None),
+                "localSearchIterations": self.local_search_iterations,
+                "localSearchMoves": self.local_search_moves,
+                "cutShort": self.cut_short,
+                **({"instrumentation": self.instrumentation.report()}
+                   if self.instrumentation is not None else {}),
             }
         }
 
 
-def generate_candidate(payload: GeneratePayload, seed: int) -> Dict[str, Any]:
+def normalize_breaks(payload: GeneratePayload):
+    """Give breaks without a valid end a one-slot length, in place."""
+    if payload.breaks:
+        if payload.breaks.mode == "same" and payload.breaks.same:
+            bs = payload.breaks.same.start
+            be = payload.breaks.same.end
+            if bs and (not be or to_minutes(be) <= to_minutes(bs)):
+                payload.breaks.same.end = from_minutes(to_minutes(bs) + payload.slotMinutes)
+        elif payload.breaks.mode == "per-day" and payload.breaks.perDay:
+            for day, bw in list(payload.breaks.perDay.items()):
+                bs = bw.start; be = bw.end
+                if bs and (not be or to_minutes(be) <= to_minutes(bs)):
+                    payload.breaks.perDay[day].end = from_minutes(to_minutes(bs) + payload.slotMinutes)
+
+
+def generate_candidate(payload: GeneratePayload, seed: int,
+                       strategy: str = DEFAULT_STRATEGY,
+                       progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                       should_stop: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
     """Generate one timetable candidate using CSP solver.
 
     Hard Constraints:
@@ -897,50 +2579,44 @@ def generate_candidate(payload: GeneratePayload, seed: int) -> Dict[str, Any]:
     5. Prefer middle time slots (9 AM - 5 PM)
     6. Minimize gaps in class schedules
     """
-    random.seed(seed)
-
-    # Normalize breaks
-    def to_min(t: str) -> int:
-        h, m = t.split(":"); return int(h) * 60 + int(m)
-    def from_min(x: int) -> str:
-        h = x // 60; m = x % 60; return f"{h:02d}:{m:02d}"
-    
-    if payload.breaks:
-        if payload.breaks.mode == "same" and payload.breaks.same:
-            bs = payload.breaks.same.start
-            be = payload.breaks.same.end
-            if bs and (not be or to_min(be) <= to_min(bs)):
-                payload.breaks.same.end = from_min(to_min(bs) + payload.slotMinutes)
-        elif payload.breaks.mode == "per-day" and payload.breaks.perDay:
-            for day, bw in list(payload.breaks.perDay.items()):
-                bs = bw.start; be = bw.end
-                if bs and (not be or to_min(be) <= to_min(bs)):
-                    payload.breaks.perDay[day].end = from_min(to_min(bs) + payload.slotMinutes)
+    normalize_breaks(payload)
     
     # Create and solve CSP
     try:
-        # Limit solve time to avoid hanging; adjustable if needed
-        solver = CSPSolver(payload, seed, max_seconds=8.0)
+        # Limit solve time to avoid hanging; set per request via timeLimitSeconds
+        solver = CSPSolver(payload, seed, max_seconds=payload.timeLimitSeconds, strategy=strategy,
+                           progress=progress, should_stop=should_stop,
+                           instrumentation=solver_instrumentation(payload))
     except Exception as e:
         raise HTTPException(status_code=400, detail={
             "message": f"Failed to initialize CSP solver: {str(e)}",
             "hint": "Check that rooms, time slots, and breaks are properly configured."
         })
     
-    # Log initial state
-    print(f"\n=== CSP Solver Initialized ===")
-    print(f"Variables: {len(solver.variables)}")
-    print(f"Rooms: {len(payload.rooms)}")
-    print(f"Time slots: {len(payload.timeslots)}")
-    empty_domains = [v for v in solver.variables if solver.domains[v.id].is_empty()]
-    if empty_domains:
-        print(f"WARNING: {len(empty_domains)} variables have empty domains from start!")
-        for v in empty_domains[:3]:
-            print(f"  - {v}")
-    print(f"==============================\n")
+    # Log initial state; sessions with empty domains were logged while building them
+    logger.info("CSP solver initialized", extra={"fields": {
+        "strategy": strategy,
+        "seed": seed,
+        "variables": len(solver.variables),
+        "rooms": len(payload.rooms),
+        "timeSlots": len(payload.timeslots),
+        "emptyDomains": sum(1 for v in solver.variables if solver.domains[v.id].is_empty()),
+    }})
     
     # Attempt to solve with timeout protection
     success = solver.solve()
+    logger.info("CSP solve finished", extra={"fields": {
+        "strategy": strategy,
+        "seed": seed,
+        "success": success,
+        "timedOut": solver.timed_out,
+        "solveSeconds": round(solver._solve_seconds, 3),
+        "backtracks": solver.backtracks,
+        "constraintsChecked": solver.constraints_checked,
+    }})
+    
+    if not success and payload.allowPartial:
+        return solver.get_partial_solution()
     
     if not success:
         # Get diagnostic information
@@ -965,6 +2641,8 @@ def generate_candidate(payload: GeneratePayload, seed: int) -> Dict[str, Any]:
                 "assignedVariables": len([v for v in solver.variables if v.assignment]),
                 "constraintsChecked": solver.constraints_checked,
                 "backtracks": solver.backtracks,
+                **({"instrumentation": solver.instrumentation.report()}
+                   if solver.instrumentation is not None else {}),
             },
             "hint": "Solver timed out or insufficient resources. Try: adding more rooms, extending time windows, reducing sessions, or adjusting break times."
         })
@@ -972,17 +2650,326 @@ def generate_candidate(payload: GeneratePayload, seed: int) -> Dict[str, Any]:
     # Get the solution
     return solver.get_solution()
 
+# ==================== METRICS ====================
+
+# Bucket upper bounds of the solve-time and domain-size histograms
+SOLVE_SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+DOMAIN_SIZE_BUCKETS = tuple([0] + [1 << i for i in range(13)])
+
+# name -> (type, help) of every metric SolverMetrics exports
+METRIC_HELP = {
+    "csp_runs_total": ("counter", "Candidate runs by strategy and outcome."),
+    "csp_backtracks_total": ("counter", "Backtracks made by solver runs."),
+    "csp_constraints_checked_total": ("counter", "Hard-constraint checks made by solver runs."),
+    "csp_solve_seconds": ("histogram", "Seconds spent in CSPSolver.solve per run."),
+    "csp_phase_seconds_total": ("counter", "Inclusive seconds per solver phase (instrumented runs)."),
+    "csp_phase_calls_total": ("counter", "Calls per solver phase (instrumented runs)."),
+    "csp_pruned_values_total": ("counter", "Domain values pruned per constraint (instrumented runs)."),
+    "csp_rejected_values_total": ("counter", "Values rejected per hard constraint (instrumented runs)."),
+    "csp_soft_penalties_total": ("counter", "Non-zero soft-constraint penalties (instrumented runs)."),
+    "csp_selected_domain_size": ("histogram", "Domain size of each selected variable (instrumented runs)."),
+}
+
+
+class SolverMetrics:
+    """Process-wide solver counters in the Prometheus text format, served on /metrics.
+    
+    Solves run in worker processes, so everything is recorded here in the
+    API process from the stats each run returns. The per-phase and
+    per-constraint series only grow for runs that set instrument.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (name, label pairs) -> value
+        self.counters: Dict[Tuple[str, Tuple], float] = defaultdict(float)
+        # (name, label pairs) -> {"bounds", "counts" per bucket plus +Inf, "sum", "count"}
+        self.histograms: Dict[Tuple[str, Tuple], Dict[str, Any]] = {}
+    
+    def record(self, strategy: str, outcome: str, stats: Dict[str, Any]):
+        """Count one run: outcome is "complete", "partial", "failed" or "cached"."""
+        with self._lock:
+            self._inc("csp_runs_total", {"strategy": strategy, "outcome": outcome})
+            if outcome == "cached":
+                return
+            self._inc("csp_backtracks_total", {"strategy": strategy}, stats.get("backtracks", 0))
+            self._inc("csp_constraints_checked_total", {"strategy": strategy},
+                      stats.get("constraintsChecked", 0))
+            if "solveSeconds" in stats:
+                self._observe("csp_solve_seconds", {"strategy": strategy}, SOLVE_SECONDS_BUCKETS,
+                              {stats["solveSeconds"]: 1}, stats["solveSeconds"])
+            
+            report = stats.get("instrumentation")
+            if not report:
+                return
+            for phase, timing in report["phases"].items():
+                self._inc("csp_phase_seconds_total", {"phase": phase}, timing["seconds"])
+                self._inc("csp_phase_calls_total", {"phase": phase}, timing["calls"])
+            for name, key in (("csp_pruned_values_total", "pruned"),
+                              ("csp_rejected_values_total", "rejected"),
+                              ("csp_soft_penalties_total", "softHits")):
+                for constraint, count in report[key].items():
+                    self._inc(name, {"constraint": constraint}, count)
+            sizes = report["domainSizes"]["atSelection"]
+            self._observe("csp_selected_domain_size", {}, DOMAIN_SIZE_BUCKETS,
+                          {int(bound): count for bound, count in sizes["buckets"].items()}, sizes["sum"])
+    
+    def _inc(self, name: str, labels: Dict[str, str], amount: float = 1):
+        self.counters[(name, tuple(labels.items()))] += amount
+    
+    def _observe(self, name: str, labels: Dict[str, str], bounds: Tuple,
+                 counts: Dict[float, int], total: float):
+        """Add counts (observed value -> times seen) whose values sum to total."""
+        key = (name, tuple(labels.items()))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = {"bounds": bounds, "counts": [0] * (len(bounds) + 1),
+                                                "sum": 0.0, "count": 0}
+        for value, count in counts.items():
+            histogram["counts"][bisect.bisect_left(bounds, value)] += count
+            histogram["count"] += count
+        histogram["sum"] += total
+    
+    def render(self) -> str:
+        with self._lock:
+            series: Dict[str, List[str]] = defaultdict(list)
+            for (name, labels), value in sorted(self.counters.items()):
+                series[name].append(f"{name}{_metric_labels(labels)} {_metric_value(value)}")
+            for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                cumulative = 0
+                for bound, count in zip(histogram["bounds"] + ("+Inf",), histogram["counts"]):
+                    cumulative += count
+                    series[name].append(f"{name}_bucket{_metric_labels(labels + (('le', str(bound)),))} "
+                                        f"{cumulative}")
+                series[name].append(f"{name}_sum{_metric_labels(labels)} {_metric_value(histogram['sum'])}")
+                series[name].append(f"{name}_count{_metric_labels(labels)} {histogram['count']}")
+        
+        lines = []
+        for name, (kind, description) in METRIC_HELP.items():
+            if name in series:
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}", *series[name]]
+        return "\n".join(lines) + "\n"
+
+
+def _metric_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+def _metric_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+solver_metrics = SolverMetrics()
+
+# ==================== RESULT CACHE ====================
+
+def canonical_payload_hash(payload: GeneratePayload) -> str:
+    """Stable hash of everything in the payload that affects a single solve.
+    
+    Run-selection fields (algorithms, candidateCount, topK) are left out;
+    the cache key adds the strategy and seed of each run separately. The
+    time limits are left out too. A run that a limit cut short
+    (stats["cutShort"]) is never cached, and any other run finds the same
+    timetable whatever its limits.
+    """
+    data = payload.model_dump(mode="json",
+                              exclude={"algorithms", "candidateCount", "topK",
+                                       "timeLimitSeconds", "localSearchSeconds"})
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def candidate_cache_key(payload: GeneratePayload, seed: int, strategy: str) -> str:
+    return f"{SOLVER_VERSION}:{strategy}:{seed}:{canonical_payload_hash(payload)}"
+
+
+class ResultCache:
+    """LRU cache of generated candidates with TTL expiry.
+    
+    Entries are stored as JSON text, so every hit returns a fresh copy.
+    With a path, entries are also written to SQLite and looked up there on
+    a memory miss, which keeps the cache across restarts.
+    """
+    def __init__(self, max_entries: int, ttl_seconds: float, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path and max_entries > 0:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, created REAL, value TEXT)")
+            self._db.commit()
+    
+    def _expired(self, created: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created > self.ttl_seconds
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._entries[key]
+                entry = None
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT created, value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None and not self._expired(row[0]):
+                    entry = (row[0], row[1])
+                    self._store(key, entry)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return json.loads(entry[1])
+    
+    def put(self, key: str, value: Dict[str, Any]):
+        if self.max_entries <= 0:
+            return
+        entry = (time.time(), json.dumps(value))
+        with self._lock:
+            self._store(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO results (key, created, value) VALUES (?, ?, ?)",
+                                 (key, entry[0], entry[1]))
+                if self.ttl_seconds > 0:
+                    self._db.execute("DELETE FROM results WHERE created < ?",
+                                     (entry[0] - self.ttl_seconds,))
+                self._db.execute(
+                    "DELETE FROM results WHERE key NOT IN "
+                    "(SELECT key FROM results ORDER BY created DESC LIMIT ?)", (self.max_entries,))
+                self._db.commit()
+    
+    def _store(self, key: str, entry: Tuple[float, str]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+# Created on first use, so importing the module (as pool workers do) opens no database
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> ResultCache:
+    """Create the candidate result cache on first use."""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(CSP_CACHE_SIZE, CSP_CACHE_TTL, CSP_CACHE_PATH)
+    return _result_cache
+
+
+def _generate_candidate_worker(payload: GeneratePayload, seed: int, strategy: str,
+                               progress_queue=None, run: int = 0,
+                               cancel_event=None, deadline: Optional[float] = None) -> Dict[str, Any]:
+    """Process-pool entry point for generate_candidate.
+    
+    HTTPException cannot be pickled back to the parent, so structured
+    failures are returned as data and re-raised by run_candidate. Progress
+    events are tagged with the run index and put on progress_queue; setting
+    cancel_event stops the search. With a deadline (a time.time() value)
+    the search gets only what is left until then, however long the run
+    waited for a worker.
+    """
+    if deadline is not None:
+        payload = payload.model_copy(update={"timeLimitSeconds": max(0.0, deadline - time.time())})
+    progress = (None if progress_queue is None else
+                lambda snapshot: progress_queue.put({"event": "progress", "run": run, "strategy": strategy,
+                                                     "seed": seed, **snapshot}))
+    try:
+        return {"ok": True, "candidate": generate_candidate(
+            payload, seed, strategy, progress, cancel_event.is_set if cancel_event is not None else None)}
+    except HTTPException as e:
+        return {"ok": False, "status_code": e.status_code, "detail": e.detail}
+
+
+async def run_candidate(payload: GeneratePayload, seed: int,
+                        strategy: str = DEFAULT_STRATEGY,
+                        progress_queue=None, run: int = 0, cancel_event=None) -> Dict[str, Any]:
+    """Run generate_candidate in the process pool without blocking the event loop.
+    
+    Successful candidates are cached by payload hash, strategy and seed;
+    failures, partial candidates and runs cut short are not cached since a
+    later run may get a larger budget.
+    """
+    key = candidate_cache_key(payload, seed, strategy)
+    cached = get_result_cache().get(key)
+    if cached is not None:
+        cached["stats"]["cached"] = True
+        solver_metrics.record(strategy, "cached", cached["stats"])
+        return cached
+    
+    if payload.decompose:
+        outcome = await run_decomposed(payload, seed, strategy, progress_queue, run, cancel_event)
+    else:
+        loop = asyncio.get_running_loop()
+        outcome = await loop.run_in_executor(get_process_pool(), _generate_candidate_worker,
+                                             payload, seed, strategy, progress_queue, run, cancel_event)
+    if not outcome["ok"]:
+        detail = outcome["detail"]
+        solver_metrics.record(strategy, "failed", detail.get("stats", {}) if isinstance(detail, dict) else {})
+        raise HTTPException(status_code=outcome["status_code"], detail=detail)
+    stats = outcome["candidate"]["stats"]
+    partial = stats.get("partial", False)
+    solver_metrics.record(strategy, "partial" if partial else "complete", stats)
+    if not partial and not stats.get("cutShort"):
+        get_result_cache().put(key, outcome["candidate"])
+    return outcome["candidate"]
+
+
+def candidate_rank(candidate: Dict[str, Any]) -> Tuple[int, float]:
+    """Sort key for candidates: complete timetables first, then soft score."""
+    return len(candidate.get("unplaced", ())), candidate["stats"]["softScore"]
+
+
+def plan_candidates(payload: GeneratePayload) -> List[Tuple[str, int]]:
+    """(strategy, seed) for each requested run, cycling strategies before seeds."""
+    strategies = resolve_strategies(payload.algorithms)
+    return [(strategies[i % len(strategies)], candidate_seed(i // len(strategies)))
+            for i in range(payload.candidateCount)]
+
+
 @app.post("/timetables/generate")
 async def generate(payload: GeneratePayload):
-    """Generate timetable candidates using CSP solver with different seeds."""
+    """Generate timetable candidates using CSP solver with different seeds.
+    
+    Runs candidateCount solves across the requested strategies in parallel
+    and returns the successful ones best soft score first, trimmed to topK.
+    With allowPartial, failed runs return partial candidates, ranked after
+    every complete one.
+    """
     try:
-        # Generate multiple candidates with different random seeds
-        # This provides variety while maintaining constraint satisfaction
-        candidates = [
-            generate_candidate(payload, seed=42),
-            generate_candidate(payload, seed=1337),
-            generate_candidate(payload, seed=2025),
-        ]
+        plan = plan_candidates(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e)})
+    
+    async def run_indexed(index: int, strategy: str, seed: int):
+        return index, await run_candidate(payload, seed, strategy)
+    
+    try:
+        # One run per worker process; collect results as they finish so a
+        # failing configuration does not hold back the others
+        ranked = []
+        failures = []
+        runs = [run_indexed(i, strategy, seed) for i, (strategy, seed) in enumerate(plan)]
+        for finished in asyncio.as_completed(runs):
+            try:
+                index, candidate = await finished
+            except HTTPException as e:
+                failures.append(e)
+                continue
+            ranked.append((candidate_rank(candidate), index, candidate))
     except HTTPException as e:
         # Bubble up structured scheduling failures
         raise e
@@ -993,8 +2980,834 @@ async def generate(payload: GeneratePayload):
             "type": type(e).__name__
         })
     
+    if not ranked:
+        raise failures[0]
+    
+    ranked.sort(key=lambda r: (r[0], r[1]))
+    candidates = [candidate for _, _, candidate in ranked]
+    if payload.topK:
+        candidates = candidates[:payload.topK]
+    
     return {"candidates": candidates}
 
+@app.post("/timetables/generate/stream")
+async def generate_stream(payload: GeneratePayload):
+    """Streaming variant of /timetables/generate.
+    
+    Responds with NDJSON events: "start" with the run plan, "progress"
+    from running solvers, "candidate" or "error" per run as soon as it
+    finishes, and a final "done" whose ranking lists run indexes best soft
+    score first, trimmed to topK.
+    """
+    try:
+        plan = plan_candidates(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e)})
+    
+    async def events():
+        manager = get_progress_manager()
+        progress_queue = manager.Queue()
+        cancel_event = manager.Event()
+        tasks = {
+            asyncio.ensure_future(run_candidate(payload, seed, strategy, progress_queue, i, cancel_event)): i
+            for i, (strategy, seed) in enumerate(plan)
+        }
+        yield {"event": "start", "runs": [{"run": i, "strategy": s, "seed": seed}
+                                          for i, (s, seed) in enumerate(plan)]}
+        
+        def drain():
+            out = []
+            while True:
+                try:
+                    out.append(progress_queue.get_nowait())
+                except queue.Empty:
+                    return out
+        
+        ranked = []
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=0.25)
+                for event in drain():
+                    yield event
+                for task in done:
+                    run = tasks[task]
+                    try:
+                        candidate = task.result()
+                    except HTTPException as e:
+                        yield {"event": "error", "run": run, "status": e.status_code, "detail": e.detail}
+                        continue
+                    except Exception as e:
+                        yield {"event": "error", "run": run, "status": 400, "detail": {
+                            "message": f"Unexpected error during generation: {str(e)}",
+                            "type": type(e).__name__
+                        }}
+                        continue
+                    ranked.append((candidate_rank(candidate), run))
+                    yield {"event": "candidate", "run": run, "candidate": candidate}
+        finally:
+            # Client went away: stop the solves already running in the pool
+            # and the runs that have not started yet
+            if pending:
+                cancel_event.set()
+            for task in pending:
+                task.cancel()
+        
+        ranked.sort()
+        ranking = [run for _, run in ranked]
+        if payload.topK:
+            ranking = ranking[:payload.topK]
+        yield {"event": "done", "candidates": len(ranked), "ranking": ranking}
+    
+    async def ndjson():
+        async for event in events():
+            yield json.dumps(event) + "\n"
+    
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Solver counters since startup in the Prometheus text exposition format."""
+    return PlainTextResponse(solver_metrics.render(), media_type="text/plain; version=0.0.4")
+
+# ==================== BACKGROUND JOBS ====================
+
+JOB_FINISHED = ("completed", "failed", "cancelled")
+
+
+class JobStore:
+    """SQLite-backed record of generation jobs.
+    
+    A job holds its payload, status (queued, running, completed, failed,
+    cancelled), latest progress per run, best candidate so far and the
+    ranked candidates. Queued and running jobs are picked up again by
+    resume_jobs after a restart.
+    """
+    _JSON_FIELDS = ("payload", "progress", "best", "candidates", "error")
+    
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, created REAL, "
+            "updated REAL, payload TEXT, progress TEXT, best TEXT, candidates TEXT, error TEXT)")
+        self._db.commit()
+    
+    def create(self, payload: GeneratePayload) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, created, updated, payload, progress, candidates) "
+                "VALUES (?, 'queued', ?, ?, ?, '{}', '[]')",
+                (job_id, now, now, payload.model_dump_json()))
+            self._db.commit()
+        return job_id
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, created, updated, payload, progress, best, candidates, error "
+                "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(("id", "status", "created", "updated") + self._JSON_FIELDS, row))
+        for field in self._JSON_FIELDS:
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        return job
+    
+    def update(self, job_id: str, **fields):
+        columns = ["updated = ?"]
+        values: List[Any] = [time.time()]
+        for name, value in fields.items():
+            columns.append(f"{name} = ?")
+            values.append(json.dumps(value) if name in self._JSON_FIELDS else value)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {', '.join(columns)} WHERE id = ?", values + [job_id])
+            self._db.commit()
+    
+    def unfinished(self) -> List[str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created").fetchall()
+        return [r[0] for r in rows]
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# Opened by lifespan, so importing the module creates no database
+job_store: Optional[JobStore] = None
+
+_job_slots: Optional[asyncio.Semaphore] = None
+_job_tasks: Dict[str, "asyncio.Task"] = {}
+_job_cancel_events: Dict[str, Any] = {}
+
+
+def start_job(job_id: str):
+    global _job_slots
+    if _job_slots is None:
+        _job_slots = asyncio.Semaphore(CSP_MAX_JOBS)
+    task = asyncio.ensure_future(_run_job(job_id))
+    _job_tasks[job_id] = task
+    task.add_done_callback(lambda _t: _job_tasks.pop(job_id, None))
+
+
+def resume_jobs():
+    """Requeue jobs left queued or running by a previous process."""
+    for job_id in job_store.unfinished():
+        job_store.update(job_id, status="queued")
+        start_job(job_id)
+
+
+async def _run_job(job_id: str):
+    """Run a job once a slot is free; an unexpected error fails the job instead of leaving it running."""
+    async with _job_slots:
+        try:
+            await _execute_job(job_id)
+        except Exception as e:
+            logger.exception("Job failed", extra={"fields": {"jobId": job_id}})
+            job_store.update(job_id, status="failed", error={"message": str(e), "type": type(e).__name__})
+
+
+async def _execute_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None or job["status"] != "queued":
+        return  # cancelled while waiting for a slot
+    payload = GeneratePayload(**job["payload"])
+    plan = plan_candidates(payload)
+    manager = get_progress_manager()
+    progress_queue = manager.Queue()
+    cancel_event = manager.Event()
+    _job_cancel_events[job_id] = cancel_event
+    job_store.update(job_id, status="running")
+    
+    tasks = {
+        asyncio.ensure_future(run_candidate(payload, seed, strategy, progress_queue, i, cancel_event)): i
+        for i, (strategy, seed) in enumerate(plan)
+    }
+    progress: Dict[str, Any] = {}
+    ranked = []
+    failures = []
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=0.5)
+            while True:
+                try:
+                    event = progress_queue.get_nowait()
+                except queue.Empty:
+                    break
+                progress[str(event["run"])] = event
+            for task in done:
+                try:
+                    candidate = task.result()
+                except HTTPException as e:
+                    failures.append(e.detail)
+                    continue
+                except Exception as e:
+                    failures.append({"message": str(e), "type": type(e).__name__})
+                    continue
+                ranked.append((candidate_rank(candidate), tasks[task], candidate))
+                ranked.sort(key=lambda r: (r[0], r[1]))
+            fields: Dict[str, Any] = {"progress": progress}
+            if done and ranked:
+                fields["best"] = ranked[0][2]
+                fields["candidates"] = [c for _, _, c in ranked]
+            job_store.update(job_id, **fields)
+    finally:
+        _job_cancel_events.pop(job_id, None)
+        for task in pending:
+            task.cancel()
+    
+    if cancel_event.is_set():
+        return  # status already set by cancel_job
+    candidates = [c for _, _, c in ranked]
+    if payload.topK:
+        candidates = candidates[:payload.topK]
+    if candidates:
+        job_store.update(job_id, status="completed", candidates=candidates)
+    else:
+        job_store.update(job_id, status="failed", error=failures[0] if failures else None)
+
+
+def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "jobId": job["id"],
+        "status": job["status"],
+        "created": job["created"],
+        "updated": job["updated"],
+        "progress": list(job["progress"].values()) if job["progress"] else [],
+        "candidatesReady": len(job["candidates"] or []),
+        "best": job["best"],
+        "error": job["error"],
+    }
+
+
+@app.post("/timetables/jobs", status_code=202)
+async def create_job(payload: GeneratePayload):
+    """Queue a generation job and return its id immediately.
+    
+    Jobs take the same payload as /timetables/generate; use
+    timeLimitSeconds for budgets beyond a synchronous request.
+    """
+    try:
+        plan_candidates(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e)})
+    job_id = job_store.create(payload)
+    start_job(job_id)
+    return {"jobId": job_id, "status": "queued"}
+
+
+@app.get("/timetables/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status, per-run progress and the best candidate found so far."""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"message": "Job not found"})
+    return _job_view(job)
+
+
+@app.get("/timetables/jobs/{job_id}/candidates")
+async def get_job_candidates(job_id: str):
+    """Candidates ranked by soft score; final once status is completed."""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"message": "Job not found"})
+    return {"jobId": job_id, "status": job["status"], "candidates": job["candidates"] or []}
+
+
+@app.post("/timetables/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job; finished jobs are left unchanged."""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"message": "Job not found"})
+    if job["status"] in JOB_FINISHED:
+        return {"jobId": job_id, "status": job["status"]}
+    job_store.update(job_id, status="cancelled")
+    cancel_event = _job_cancel_events.get(job_id)
+    if cancel_event is not None:
+        cancel_event.set()
+    return {"jobId": job_id, "status": "cancelled"}
+
+# ==================== REPAIR ====================
+
+def _matches_assignment(assignment: Dict[str, Any], spec: Dict[str, Any]) -> bool:
+    """True if assignment is the one spec names by class, course and optional type."""
+    cls = assignment.get("class") or assignment.get("class_")
+    spec_cls = spec.get("class") or spec.get("class_")
+    if str(cls) != str(spec_cls) or str(assignment.get("course")) != str(spec.get("course")):
+        return False
+    return not spec.get("type") or str(assignment.get("type", "")).lower() == str(spec["type"]).lower()
+
+
+def apply_repair_delta(payload: GeneratePayload, delta: RepairDelta) -> GeneratePayload:
+    """The problem after delta, as a new payload."""
+    updated = payload.model_copy(deep=True)
+    
+    assignments = [a for a in updated.assignments
+                   if not any(_matches_assignment(a, spec) for spec in delta.removeAssignments)]
+    for change in delta.instructorChanges:
+        for a in assignments:
+            if _matches_assignment(a, change):
+                a["instructor"] = change.get("instructor")
+    updated.assignments = assignments + [dict(a) for a in delta.addAssignments]
+    
+    removed_rooms = set(delta.removeRooms)
+    updated.rooms = [r for r in updated.rooms if r not in removed_rooms]
+    updated.rooms += [r for r in delta.addRooms if r not in updated.rooms]
+    updated.roomTypes = {**updated.roomTypes, **delta.roomTypes}
+    if updated.classLabRooms:
+        updated.classLabRooms = {cls: [r for r in rooms if r not in removed_rooms]
+                                 for cls, rooms in updated.classLabRooms.items()}
+    
+    updated.timeslots = [t for t in updated.timeslots if t not in delta.removeTimeslots]
+    updated.timeslots += [t for t in delta.addTimeslots if t not in updated.timeslots]
+    return updated
+
+
+def repair_candidate(request: RepairPayload) -> Dict[str, Any]:
+    """Re-solve only the part of an existing timetable that a delta breaks.
+    
+    Sessions whose old placement is still valid are pinned and the rest
+    solved around them, widening the free set when that fails (see
+    CSPSolver.solve_around). All rounds share payload.timeLimitSeconds.
+    If no round succeeds this is a 400 unless payload.allowPartial is set,
+    in which case the best partial timetable is returned, as in
+    /timetables/generate.
+    """
+    started = time.time()
+    try:
+        strategy = resolve_strategies([request.algorithm])[0]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e)})
+    
+    payload = apply_repair_delta(request.payload, request.delta)
+    normalize_breaks(payload)
+    try:
+        solver = CSPSolver(payload, request.seed, max_seconds=payload.timeLimitSeconds, strategy=strategy,
+                           instrumentation=solver_instrumentation(payload))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail={
+            "message": f"Failed to initialize CSP solver: {str(e)}",
+            "hint": "Check that rooms, time slots, and breaks are properly configured."
+        })
+    # Local search would move the sessions the repair is meant to keep
+    solver.options["local_search"] = None
+    
+    try:
+        previous, removed = solver.values_from_details(request.details)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e)})
+    valid = {var_id: value for var_id, value in previous.items()
+             if solver.in_domain(solver.variables[var_id], value)}
+    success, free, rounds = solver.solve_around(valid)
+    
+    if not success and not payload.allowPartial:
+        raise HTTPException(status_code=400, detail={
+            "message": "Could not repair the timetable within the time limit.",
+            "rounds": rounds,
+            "freeSessions": len(free),
+            "hint": "Retry with allowPartial to get the sessions that still fit, or run a full generation."
+        })
+    candidate = solver.get_solution() if success else solver.get_partial_solution()
+    
+    moved = sum(1 for var_id, value in previous.items()
+                if solver.variables[var_id].assignment != value)
+    return {
+        "candidate": candidate,
+        "repair": {
+            "moved": moved,
+            "kept": len(previous) - moved,
+            "added": len(solver.variables) - len(previous),
+            "removed": removed,
+            "freeSessions": len(free),
+            "rounds": rounds,
+            "seconds": round(time.time() - started, 3),
+        },
+    }
+
+
+def _repair_candidate_worker(request: RepairPayload) -> Dict[str, Any]:
+    """Process-pool entry point for repair_candidate; see _generate_candidate_worker.
+    
+    Other errors come from malformed client input and become 400s, as in
+    /timetables/generate.
+    """
+    try:
+        return {"ok": True, "result": repair_candidate(request)}
+    except HTTPException as e:
+        return {"ok": False, "status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        return {"ok": False, "status_code": 400, "detail": {
+            "message": f"Unexpected error during repair: {str(e)}",
+            "type": type(e).__name__
+        }}
+
+
+@app.post("/timetables/repair")
+async def repair(request: RepairPayload):
+    """Apply a small edit to an existing timetable, moving as few sessions as possible.
+    
+    Returns the repaired candidate and how many sessions were kept, moved,
+    added and removed. A repair that cannot complete is a 400 unless
+    payload.allowPartial asks for the partial timetable instead.
+    """
+    loop = asyncio.get_running_loop()
+    outcome = await loop.run_in_executor(get_process_pool(), _repair_candidate_worker, request)
+    if not outcome["ok"]:
+        raise HTTPException(status_code=outcome["status_code"], detail=outcome["detail"])
+    return outcome["result"]
+
+# ==================== DECOMPOSITION ====================
+
+# A decomposed group may carry at most this multiple of the institute's
+# sessions per room in each room pool; fewer, larger groups are formed otherwise
+DECOMPOSE_LOAD_SLACK = 1.25
+
+# Counters summed over a decomposed run's sub-problems and its reconciliation
+PART_STAT_COUNTERS = ("constraintsChecked", "backtracks", "arcRevisions", "arcPrunedInitial",
+                      "arcPrunedSearch", "backjumps", "levelsSkipped", "nogoodsLearned",
+                      "nogoodHits", "localSearchIterations", "localSearchMoves")
+
+
+def _share_rooms(rooms: List[str], demands: List[int]) -> List[List[str]]:
+    """Split rooms between groups by demand, one at least to each group with any.
+    
+    Every further room goes to the group with the most demand per room so
+    far, which keeps the busiest group's load as low as it can be.
+    """
+    seats = [1 if demand else 0 for demand in demands]
+    for _ in range(len(rooms) - sum(seats)):
+        busiest = max((i for i, demand in enumerate(demands) if demand),
+                      key=lambda i: (demands[i] / seats[i], -i), default=None)
+        if busiest is None:
+            break
+        seats[busiest] += 1
+    shares = []
+    offset = 0
+    for count in seats:
+        shares.append(rooms[offset:offset + count])
+        offset += count
+    return shares
+
+
+def decompose_payload(payload: GeneratePayload) -> Tuple[List[GeneratePayload], int]:
+    """Split payload into independent sub-problems, plus the number of components.
+    
+    Classes sharing an instructor or a classLabRooms room depend on each
+    other and form one connected component. The global room pools (the
+    lecture rooms and the unrestricted lab rooms) couple every component,
+    so components are packed into groups, largest first into the smallest
+    group, and each group gets a disjoint share of every pool sized by its
+    demand. The most groups whose shares all stay within
+    DECOMPOSE_LOAD_SLACK of the institute's load are used. Solutions of the
+    groups then never clash and simply merge. Returns [payload] when it
+    cannot be split.
+    """
+    parent: Dict[str, str] = {}
+    
+    def find(name: str) -> str:
+        while parent.setdefault(name, name) != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+    
+    def union(a: str, b: str):
+        parent[find(a)] = find(b)
+    
+    sessions: Dict[str, List[int]] = defaultdict(lambda: [0, 0, 0])  # class -> lectures, labs, restricted labs
+    by_instructor: Dict[str, str] = {}
+    by_room: Dict[str, str] = {}
+    lecture_pool = lecture_rooms(payload)
+    shared_labs = [r for r in payload.rooms if payload.roomTypes.get(r, "Class") == "Lab"]
+    restricted: Set[str] = set()
+    for a in payload.assignments:
+        cls, course, typ = a.get("class") or a.get("class_"), a.get("course"), a.get("type")
+        if not cls or not course or not typ:
+            continue
+        cls = str(cls)
+        find(cls)
+        if a.get("instructor"):
+            union(cls, by_instructor.setdefault(str(a["instructor"]), cls))
+        if str(typ).lower() not in ("lab", "laboratory"):
+            sessions[cls][0] += max(1, int(a.get("creditHours", 1)))
+            continue
+        if payload.classLabRooms and cls in payload.classLabRooms:
+            rooms = lab_rooms_for_class(payload, cls)
+            if set(rooms) & set(lecture_pool):
+                return [payload], 1  # falls back to every room, coupling everything
+            for room in rooms:
+                union(cls, by_room.setdefault(room, cls))
+            restricted.update(rooms)
+            sessions[cls][2] += 1
+        else:
+            sessions[cls][1] += 1
+    shared_labs = [r for r in shared_labs if r not in restricted]
+    
+    components: Dict[str, List[str]] = defaultdict(list)
+    for cls in parent:
+        components[find(cls)].append(cls)
+    components = list(components.values())
+    
+    def demand(classes: List[str], kind: int) -> int:
+        return sum(sessions[cls][kind] for cls in classes)
+    
+    def size(classes: List[str]) -> int:
+        return sum(sum(sessions[cls]) for cls in classes)
+    
+    count = len(components)
+    if any(demand(classes, 0) for classes in components):
+        count = min(count, len(lecture_pool))
+    if any(demand(classes, 1) for classes in components):
+        if not shared_labs or set(shared_labs) & set(lecture_pool):
+            return [payload], len(components)
+        count = min(count, len(shared_labs))
+    
+    pools = ((0, lecture_pool), (1, shared_labs))
+    totals = {kind: demand(list(parent), kind) for kind, _ in pools}
+    components.sort(key=lambda classes: -size(classes))
+    for count in range(count, 1, -1):
+        groups: List[List[str]] = [[] for _ in range(count)]
+        for classes in components:
+            min(groups, key=size).extend(classes)
+        shares = {kind: _share_rooms(rooms, [demand(g, kind) for g in groups]) for kind, rooms in pools}
+        if all(demand(g, kind) <= DECOMPOSE_LOAD_SLACK * len(share) * totals[kind] / len(rooms)
+               for kind, rooms in pools if rooms
+               for g, share in zip(groups, shares[kind])):
+            break
+    else:
+        return [payload], len(components)
+    
+    parts = []
+    for classes, lecture_share, lab_share in zip(groups, shares[0], shares[1]):
+        members = set(classes)
+        own = set(lecture_share) | set(lab_share) | {room for room, cls in by_room.items() if cls in members}
+        parts.append(payload.model_copy(deep=True, update={
+            "classes": [c for c in payload.classes if c in members] or classes,
+            "assignments": [dict(a) for a in payload.assignments
+                            if str(a.get("class") or a.get("class_")) in members],
+            "rooms": [r for r in payload.rooms if r in own],
+            "classLabRooms": ({cls: rooms for cls, rooms in payload.classLabRooms.items() if cls in members}
+                              if payload.classLabRooms else None),
+            # A failed part still hands its placements to the reconciliation
+            "allowPartial": True,
+            "decompose": False,
+        }))
+    return parts, len(components)
+
+
+def reconcile_candidates(payload: GeneratePayload, seed: int, strategy: str,
+                         parts: List[Optional[Dict[str, Any]]], components: int,
+                         should_stop: Optional[Callable[[], bool]] = None,
+                         run_started: Optional[float] = None) -> Dict[str, Any]:
+    """Merge the sub-problem candidates of a decomposed run into one timetable.
+    
+    Every placement is pinned on a solver over the whole payload, and the
+    sessions a part left unplaced (or a failed part's whole share) are
+    solved around them with CSPSolver.solve_around, which may move pinned
+    sessions into rooms of other groups. CSPSolver.settle then wins back
+    what the room split cost, now that every room is open to every
+    session. The result is an ordinary candidate whose counters add up
+    every part's, with a "decomposition" stats entry. Its solveSeconds and
+    firstSolutionSeconds are wall-clock seconds since run_started (when
+    the parts were launched; this call by default), so they cover the
+    parts as well as the reconciliation.
+    
+    The parts and the reconciliation share payload.timeLimitSeconds: the
+    reconciliation only gets what the parts left of it, and with nothing
+    left the run is a timeout (a partial timetable with allowPartial).
+    """
+    started = time.time()
+    if run_started is None:
+        run_started = started
+    remaining = max(0.0, payload.timeLimitSeconds - (started - run_started))
+    if remaining == 0 and not payload.allowPartial:
+        raise HTTPException(status_code=400, detail={
+            "message": "The decomposed run spent its whole time limit on the sub-problems.",
+            "timedOut": True,
+            "hint": "Retry without decompose, or with a larger timeLimitSeconds."
+        })
+    normalize_breaks(payload)
+    try:
+        solver = CSPSolver(payload, seed, max_seconds=remaining, strategy=strategy,
+                           should_stop=should_stop, instrumentation=solver_instrumentation(payload))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail={
+            "message": f"Failed to initialize CSP solver: {str(e)}",
+            "hint": "Check that rooms, time slots, and breaks are properly configured."
+        })
+    # The parts have already been improved and share no soft constraints
+    solver.options["local_search"] = None
+    
+    details = [row for part in parts if part is not None for row in part["details"]]
+    previous, _ = solver.values_from_details(details)
+    valid = {var_id: value for var_id, value in previous.items()
+             if solver.in_domain(solver.variables[var_id], value)}
+    success, free, rounds = solver.solve_around(valid)
+    merged = time.time()
+    settled = solver.settle() if success else 0
+    if not success and not payload.allowPartial:
+        raise HTTPException(status_code=400, detail={
+            "message": "CSP Solver failed to find a complete solution for the decomposed problem.",
+            "unassigned": [{"class": v.class_name, "course": v.course, "type": v.session_type}
+                           for v in solver.variables if v.assignment is None][:10],
+            "timedOut": solver.timed_out,
+            "hint": "Retry without decompose, or with a larger timeLimitSeconds."
+        })
+    candidate = solver.get_solution() if success else solver.get_partial_solution()
+    
+    stats = candidate["stats"]
+    stats["solveSeconds"] = round(time.time() - run_started, 3)
+    stats["firstSolutionSeconds"] = round(merged - run_started, 3) if success else None
+    part_stats = [part["stats"] if part is not None else None for part in parts]
+    solved = [part for part in part_stats if part is not None]
+    for key in PART_STAT_COUNTERS:
+        stats[key] += sum(part.get(key, 0) for part in solved)
+    stats["localSearch"] = strategy_options(strategy)["local_search"]
+    # A part that failed, timed out or was cut short makes the merge timing-dependent
+    stats["cutShort"] = solver.cut_short or any(
+        part is None or part.get("cutShort") or part.get("timedOut") for part in part_stats)
+    if stats["localSearch"] and len(solved) == len(parts):
+        stats["softScoreBefore"] = round(sum(
+            part["softScore"] if part["softScoreBefore"] is None else part["softScoreBefore"]
+            for part in solved), 2)
+    stats["decomposition"] = {
+        "components": components,
+        "groups": len(parts),
+        # Per part, None where it failed outright
+        "parts": [{"sessions": part["variablesAssigned"] + part.get("unplacedCount", 0),
+                   "unplaced": part.get("unplacedCount", 0),
+                   "solveSeconds": part["solveSeconds"]} if part is not None else None
+                  for part in part_stats],
+        "reconciledSessions": len(free),
+        "rounds": rounds,
+        "settleMoves": settled,
+        "reconcileSeconds": round(time.time() - started, 3),
+    }
+    return candidate
+
+
+def _reconcile_worker(payload: GeneratePayload, seed: int, strategy: str,
+                      parts: List[Optional[Dict[str, Any]]], components: int,
+                      cancel_event=None, run_started: Optional[float] = None) -> Dict[str, Any]:
+    """Process-pool entry point for reconcile_candidates; see _generate_candidate_worker."""
+    try:
+        return {"ok": True, "candidate": reconcile_candidates(
+            payload, seed, strategy, parts, components,
+            cancel_event.is_set if cancel_event is not None else None, run_started)}
+    except HTTPException as e:
+        return {"ok": False, "status_code": e.status_code, "detail": e.detail}
+
+
+async def run_decomposed(payload: GeneratePayload, seed: int, strategy: str,
+                         progress_queue=None, run: int = 0, cancel_event=None) -> Dict[str, Any]:
+    """Solve payload's sub-problems side by side in the process pool, then reconcile them.
+    
+    Returns a worker outcome like _generate_candidate_worker. A payload
+    that does not split runs as a single solve; progress events are only
+    reported for those, since the parts' would interleave. The parts and
+    the reconciliation together keep to payload.timeLimitSeconds.
+    """
+    started = time.time()
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    parts, components = decompose_payload(payload)
+    if len(parts) == 1:
+        outcome = await loop.run_in_executor(pool, _generate_candidate_worker,
+                                             payload, seed, strategy, progress_queue, run, cancel_event)
+        if outcome["ok"]:
+            outcome["candidate"]["stats"]["decomposition"] = {"components": components, "groups": 1}
+        return outcome
+    
+    # Parts and reconciliation share the run's time limit
+    deadline = started + payload.timeLimitSeconds
+    outcomes = await asyncio.gather(*(
+        loop.run_in_executor(pool, _generate_candidate_worker, part, seed, strategy, None, run,
+                             cancel_event, deadline)
+        for part in parts))
+    solved = [outcome["candidate"] if outcome["ok"] else None for outcome in outcomes]
+    return await loop.run_in_executor(pool, _reconcile_worker, payload, seed, strategy,
+                                      solved, components, cancel_event, started)
+
+# ==================== PROFILING ====================
+
+# ProfilePayload.sortBy -> field of a cProfile stats entry
+# (primitive calls, calls, own seconds, cumulative seconds, callers)
+PROFILE_SORT_FIELDS = {"calls": 1, "tottime": 2, "cumulative": 3}
+
+
+def profile_summary(stats: Dict[Tuple, Tuple], sort_by: str, top: int) -> List[Dict[str, Any]]:
+    """The top entries of a cProfile stats table, hottest first."""
+    field = PROFILE_SORT_FIELDS[sort_by]
+    ranked = sorted(stats.items(), key=lambda item: item[1][field], reverse=True)[:top]
+    return [{
+        "function": function,
+        "file": filename,
+        "line": line,
+        "calls": calls,
+        "primitiveCalls": primitive_calls,
+        "totalSeconds": round(own_seconds, 6),
+        "cumulativeSeconds": round(cumulative_seconds, 6),
+    } for (filename, line, function), (primitive_calls, calls, own_seconds, cumulative_seconds, _)
+        in ranked]
+
+
+def profile_candidate(request: ProfilePayload) -> Dict[str, Any]:
+    """Run one generate_candidate under cProfile and summarize where the time went.
+    
+    The run is profiled whether or not it finds a timetable, since slow
+    and timed-out instances are the ones worth looking at. The profile
+    is returned in the format pstats.Stats.dump_stats writes. With
+    CSP_PROFILE_DIR set it is also saved there as
+    <payload hash>-<strategy>-<seed>.prof, next to <payload hash>.json
+    holding the payload, so the instance can be re-run offline (see
+    benchmark.py --payload).
+    """
+    try:
+        strategy = resolve_strategies([request.algorithm])[0]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e)})
+    
+    payload = request.payload
+    payload_hash = canonical_payload_hash(payload)
+    payload_json = payload.model_dump_json(indent=2)
+    
+    candidate = None
+    error = None
+    profiler = cProfile.Profile()
+    started = time.time()
+    profiler.enable()
+    try:
+        candidate = generate_candidate(payload, request.seed, strategy)
+    except HTTPException as e:
+        error = e.detail
+    finally:
+        profiler.disable()
+    seconds = time.time() - started
+    profiler.create_stats()
+    artifact = marshal.dumps(profiler.stats)
+    
+    path = None
+    if CSP_PROFILE_DIR:
+        os.makedirs(CSP_PROFILE_DIR, exist_ok=True)
+        path = os.path.join(CSP_PROFILE_DIR, f"{payload_hash}-{strategy}-{request.seed}.prof")
+        with open(path, "wb") as f:
+            f.write(artifact)
+        with open(os.path.join(CSP_PROFILE_DIR, f"{payload_hash}.json"), "w", encoding="utf-8") as f:
+            f.write(payload_json)
+    
+    if candidate is not None:
+        stats = candidate["stats"]
+    else:
+        stats = error.get("stats") if isinstance(error, dict) else None
+    return {
+        "payloadHash": payload_hash,
+        "solverVersion": SOLVER_VERSION,
+        "strategy": strategy,
+        "seed": request.seed,
+        "solved": candidate is not None and not candidate["stats"].get("partial", False),
+        "seconds": round(seconds, 3),
+        "stats": stats,
+        "error": error,
+        "hotFunctions": profile_summary(profiler.stats, request.sortBy, request.top),
+        "profile": {"format": "pstats", "encoding": "base64",
+                    "data": base64.b64encode(artifact).decode("ascii")},
+        "path": path,
+    }
+
+
+def _profile_candidate_worker(request: ProfilePayload) -> Dict[str, Any]:
+    """Process-pool entry point for profile_candidate; see _repair_candidate_worker."""
+    try:
+        return {"ok": True, "result": profile_candidate(request)}
+    except HTTPException as e:
+        return {"ok": False, "status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        return {"ok": False, "status_code": 400, "detail": {
+            "message": f"Unexpected error during profiling: {str(e)}",
+            "type": type(e).__name__
+        }}
+
+
+@app.post("/timetables/profile")
+async def profile(request: ProfilePayload):
+    """Run one candidate under cProfile and return its profile and hottest functions.
+    
+    For diagnosing slow instances: the run bypasses the result cache, and
+    a run that fails or times out still returns its profile. Results are
+    keyed by the payload hash the cache uses.
+    """
+    loop = asyncio.get_running_loop()
+    outcome = await loop.run_in_executor(get_process_pool(), _profile_candidate_worker, request)
+    if not outcome["ok"]:
+        raise HTTPException(status_code=outcome["status_code"], detail=outcome["detail"])
+    return outcome["result"]
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,462 @@
+"""Solver benchmark: bundled dataset, synthetic instances and a regression runner.
+
+Runs every instance under every requested strategy and seed, one run per
+fresh process so timings and peak memory are not skewed by earlier runs,
+and writes the results to JSON. Passing an earlier results file with
+--compare reports cases that got slower, worse or stopped solving.
+
+    python benchmark.py                                  # full suite
+    python benchmark.py --instances dataset,medium --strategies CSP,CSP+MAC
+    python benchmark.py --synthetic big=classes=60,departments=4 --instances big
+    python benchmark.py --out new.json --compare old.json
+    python benchmark.py --payload profiles/<hash>.json   # re-run a profiled instance
+"""
+import argparse
+import concurrent.futures
+import csv
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import random
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app import SOLVER_VERSION, CSPSolver, GeneratePayload, generate_candidate, logger, resolve_strategies
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak memory is then not reported
+    resource = None
+
+# Per-solve info records would drown out the report; warnings still show
+logger.setLevel(logging.WARNING)
+
+DATASET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Dataset ( csv )")
+
+DAY_NAMES = {"Monday": "Mon", "Tuesday": "Tue", "Wednesday": "Wed", "Thursday": "Thu",
+             "Friday": "Fri", "Saturday": "Sat", "Sunday": "Sun"}
+
+# Course-code prefix of each degree's own courses; a class takes those before
+# courses of other degrees at its level
+DEGREE_PREFIXES = {
+    "BS Computer Science": "CS",
+    "BS Software Engineering": "SE",
+    "BS Cyber Security": "CY",
+    "BS Artificial Intelligence": "AI",
+    "BS Data Science": "CS",
+}
+
+# Break windows: "same" uses the first for every day, "per-day" staggers them
+BREAK_WINDOWS = [("12:00", "12:30"), ("11:30", "12:00"), ("12:30", "13:00"), ("13:00", "13:30")]
+
+# Synthetic instances of the default suite, see synthetic_payload
+SYNTHETIC_SUITE: Dict[str, Dict[str, Any]] = {
+    "small": {"classes": 6, "courses_per_class": 5},
+    "medium": {"classes": 20, "courses_per_class": 6, "departments": 2},
+    "large": {"classes": 48, "courses_per_class": 6, "departments": 4},
+    "scarce-rooms": {"classes": 20, "courses_per_class": 6, "room_scarcity": 0.85},
+    "lab-heavy": {"classes": 16, "courses_per_class": 6, "lab_ratio": 0.6},
+    "shared-instructors": {"classes": 20, "courses_per_class": 6, "instructor_sharing": 5},
+    "per-day-breaks": {"classes": 20, "courses_per_class": 6, "break_mode": "per-day"},
+    "no-breaks": {"classes": 20, "courses_per_class": 6, "break_mode": "none"},
+}
+
+DEFAULT_STRATEGIES = ["CSP", "CSP-FIRSTFIT", "CSP+MAC", "CSP+WDEG", "CSP+TABU"]
+
+# --compare flags a case as slower when it took this many times as long as
+# before, and at least COMPARE_MIN_SECONDS longer
+COMPARE_SLOWDOWN = 1.5
+COMPARE_MIN_SECONDS = 0.05
+
+
+def make_breaks(mode: str, days: List[str]) -> Dict[str, Any]:
+    """Break configuration in the GeneratePayload format."""
+    if mode == "same":
+        start, end = BREAK_WINDOWS[0]
+        return {"mode": "same", "same": {"start": start, "end": end}}
+    if mode == "per-day":
+        return {"mode": "per-day", "perDay": {
+            day: dict(zip(("start", "end"), BREAK_WINDOWS[i % len(BREAK_WINDOWS)]))
+            for i, day in enumerate(days)}}
+    if mode == "none":
+        return {"mode": "none"}
+    raise ValueError(f"Unknown break mode '{mode}'. Supported: same, per-day, none")
+
+
+# ==================== DATASET ====================
+
+def _read_csv(path: str, name: str) -> List[Dict[str, str]]:
+    with open(os.path.join(path, name), newline="", encoding="utf-8") as f:
+        return [{key.strip(): (value or "").strip() for key, value in row.items()}
+                for row in csv.DictReader(f)]
+
+
+def _course_level(code: str) -> int:
+    """Year of study a course code belongs to: CS1xx is first year, CS4xx fourth."""
+    match = re.search(r"\d", code)
+    return int(match.group()) if match else 1
+
+
+def load_dataset(path: str = DATASET_PATH, courses_per_class: int = 5, labs_per_class: int = 1,
+                 sections_per_instructor: int = 2, break_mode: str = "same",
+                 seed: int = 0) -> GeneratePayload:
+    """Build a GeneratePayload from the classes/courses/rooms/timeslots CSVs.
+
+    The CSVs do not say which class takes which course, so each class gets
+    courses_per_class courses of its year of study (rank 1-2 is first year,
+    3-4 second, ...), its own degree's first. Up to labs_per_class of them
+    come with their lab (lab codes are the course code plus "L"); the
+    dataset's six lab rooms only fit about 30 three-hour labs a week.
+    Instructors are made up: each course's sections are taught
+    sections_per_instructor at a time. Class names follow the frontend's
+    "degree year-section".
+    """
+    rng = random.Random(seed)
+    classes = _read_csv(path, "classes.csv")
+    courses = _read_csv(path, "courses.csv")
+    rooms = _read_csv(path, "rooms.csv")
+    timeslots = _read_csv(path, "timeslots.csv")
+
+    labs = {c["courseCode"].replace(" ", ""): c for c in courses if c["courseType"].lower() == "lab"}
+    theory = {c["courseCode"].replace(" ", "") for c in courses if c["courseType"].lower() != "lab"}
+    by_level: Dict[int, List[Dict[str, str]]] = {}
+    for course in courses:
+        code = course["courseCode"].replace(" ", "")
+        # Labs ride along with their theory course unless they have none
+        if code in labs and code[:-1] in theory:
+            continue
+        by_level.setdefault(_course_level(code), []).append(course)
+
+    class_names = []
+    assignments = []
+    taught: Dict[str, int] = {}
+    for cls in classes:
+        section = "" if cls.get("section", "").lower() in ("", "none") else cls["section"]
+        name = f"{cls['degree']} {cls['year']}-{section}"
+        class_names.append(name)
+        level = min((int(cls.get("rank") or 1) + 1) // 2, max(by_level))
+        prefix = DEGREE_PREFIXES.get(cls["degree"])
+        pool = list(by_level.get(level, []))
+        rng.shuffle(pool)
+        pool.sort(key=lambda c: not (prefix and c["courseCode"].startswith(prefix)))
+        picked = []
+        chosen = labs_taken = 0
+        for course in pool:
+            if chosen == courses_per_class:
+                break
+            code = course["courseCode"].replace(" ", "")
+            lab = course if code in labs else labs.get(code + "L")
+            if lab is not None and labs_taken == labs_per_class:
+                if lab is course:
+                    continue
+                lab = None
+            picked += [course] if lab is course else [course] + ([lab] if lab else [])
+            labs_taken += lab is not None
+            chosen += 1
+        for item in picked:
+            item_code = item["courseCode"].replace(" ", "")
+            section_index = taught.get(item_code, 0)
+            taught[item_code] = section_index + 1
+            is_lab = item["courseType"].lower() == "lab"
+            assignments.append({
+                "class": name,
+                "course": item_code,
+                "type": "Lab" if is_lab else "Lecture",
+                "creditHours": 3 if is_lab else int(item["creditHours"] or 1),
+                "instructor": f"{item_code} Instructor {section_index // sections_per_instructor + 1}",
+            })
+
+    days = [DAY_NAMES.get(t["days"], t["days"]) for t in timeslots]
+    return GeneratePayload(
+        instituteID="benchmark",
+        session=classes[0].get("session", "Fall") if classes else "Fall",
+        year=max(int(c["year"]) for c in classes) if classes else 2025,
+        classes=class_names,
+        assignments=assignments,
+        rooms=[r["roomNumber"] for r in rooms],
+        roomTypes={r["roomNumber"]: "Lab" if r["roomStatus"].lower() == "lab" else "Class" for r in rooms},
+        timeslots=[{"day": DAY_NAMES.get(t["days"], t["days"]), "start": t["startTime"], "end": t["endTime"]}
+                   for t in timeslots],
+        breaks=make_breaks(break_mode, days),
+        algorithms=["CSP"],
+    )
+
+
+# ==================== SYNTHETIC INSTANCES ====================
+
+def synthetic_payload(classes: int = 20, courses_per_class: int = 6, lab_ratio: float = 0.3,
+                      room_scarcity: float = 0.6, instructor_sharing: float = 2.0,
+                      departments: int = 1, break_mode: str = "same", days: int = 5,
+                      day_start: str = "09:00", day_end: str = "16:30",
+                      slot_minutes: int = 60, seed: int = 0) -> GeneratePayload:
+    """A random but reproducible institute.
+
+    classes: number of classes, spread evenly over departments, which
+        share rooms but not instructors
+    courses_per_class: theory courses per class, 2-3 credit hours each
+    lab_ratio: share of courses that also have a lab
+    room_scarcity: share of the week's room slots the sessions need, for
+        classrooms and lab rooms alike; rooms are sized from it
+    instructor_sharing: courses each instructor teaches on average
+    break_mode: "same", "per-day" or "none"
+    """
+    if not 0 < room_scarcity <= 1:
+        raise ValueError("room_scarcity must be in (0, 1]")
+    rng = random.Random(seed)
+    day_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"][:days]
+
+    class_names = []
+    assignments = []
+    for department in range(departments):
+        count = classes // departments + (1 if department < classes % departments else 0)
+        names = [f"D{department + 1} Class {i + 1}" for i in range(count)]
+        class_names += names
+        courses = []
+        for name in names:
+            for j in range(courses_per_class):
+                course = f"{name} C{j + 1}"
+                courses.append((name, course, "Lecture", rng.choice((2, 3))))
+                if rng.random() < lab_ratio:
+                    courses.append((name, course + "L", "Lab", 3))
+        # Deal courses out in a random order so every instructor gets the same share
+        instructors = max(1, round(len(courses) / instructor_sharing))
+        rng.shuffle(courses)
+        for i, (name, course, kind, hours) in enumerate(courses):
+            assignments.append({"class": name, "course": course, "type": kind, "creditHours": hours,
+                                "instructor": f"D{department + 1} Instructor {i % instructors + 1}"})
+
+    timeslots = [{"day": day, "start": day_start, "end": day_end} for day in day_names]
+    breaks = make_breaks(break_mode, day_names)
+    lecture_capacity, lab_capacity = room_capacity(timeslots, breaks, slot_minutes)
+    lecture_hours = sum(a["creditHours"] for a in assignments if a["type"] == "Lecture")
+    labs = sum(1 for a in assignments if a["type"] == "Lab")
+    class_rooms = max(1, math.ceil(lecture_hours / (lecture_capacity * room_scarcity)))
+    lab_rooms = math.ceil(labs / (lab_capacity * room_scarcity)) if labs and lab_capacity else 0
+    rooms = [f"R{i + 1}" for i in range(class_rooms)] + [f"Lab{i + 1}" for i in range(lab_rooms)]
+
+    return GeneratePayload(
+        instituteID="benchmark",
+        session="Fall",
+        year=2025,
+        classes=class_names,
+        assignments=assignments,
+        rooms=rooms,
+        roomTypes={room: "Lab" if room.startswith("Lab") else "Class" for room in rooms},
+        timeslots=timeslots,
+        breaks=breaks,
+        slotMinutes=slot_minutes,
+        algorithms=["CSP"],
+    )
+
+
+def room_capacity(timeslots: List[Dict[str, Any]], breaks: Dict[str, Any],
+                  slot_minutes: int) -> Tuple[int, int]:
+    """How many lectures and how many labs one room holds per week.
+
+    Read off the domains the solver builds for a one-room probe, so break
+    handling and lab block rules match the real search; overlapping
+    placements on a day are packed greedily by end time.
+    """
+    probe = GeneratePayload(
+        instituteID="probe", session="probe", year=0, classes=["P"],
+        assignments=[{"class": "P", "course": "T", "type": "Lecture", "creditHours": 1},
+                     {"class": "P", "course": "L", "type": "Lab", "creditHours": 3}],
+        rooms=["R", "L"], roomTypes={"R": "Class", "L": "Lab"},
+        timeslots=timeslots, breaks=breaks, slotMinutes=slot_minutes, algorithms=["CSP"])
+    solver = CSPSolver(probe, 0)
+
+    def packed(values: List[Tuple]) -> int:
+        count = 0
+        free_from: Dict[str, int] = {}
+        for _, day, time_slots in sorted(values, key=lambda v: (v[1], v[2][-1][1])):
+            if time_slots[0][0] >= free_from.get(day, 0):
+                free_from[day] = time_slots[-1][1]
+                count += 1
+        return count
+
+    return tuple(packed(solver.domains[var.id].values) for var in solver.variables)
+
+
+def parse_synthetic(spec: str) -> Tuple[str, Dict[str, Any]]:
+    """Parse "name=key=value,key=value" into the name and synthetic_payload arguments."""
+    name, _, params = spec.partition("=")
+    kwargs: Dict[str, Any] = {}
+    for item in filter(None, params.split(",")):
+        key, _, value = item.partition("=")
+        for convert in (int, float):
+            try:
+                kwargs[key.strip()] = convert(value)
+                break
+            except ValueError:
+                continue
+        else:
+            kwargs[key.strip()] = value.strip()
+    return name.strip(), kwargs
+
+
+# ==================== RUNNER ====================
+
+def _peak_rss_mb() -> Optional[float]:
+    """High-water resident set size of this process in MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(payload: GeneratePayload, strategy: str, seed: int) -> Dict[str, Any]:
+    """Solve payload once and measure it; meant to run in a fresh process.
+
+    peakMemoryMB is the process's peak resident set, interpreter and
+    imports included, so it is only comparable between runs of this script.
+    """
+    started = time.perf_counter()
+    result: Dict[str, Any] = {}
+    try:
+        stats = generate_candidate(payload, seed, strategy)["stats"]
+        result["solved"] = not stats.get("partial", False)
+    except HTTPException as e:
+        detail = e.detail if isinstance(e.detail, dict) else {"message": str(e.detail)}
+        stats = detail.get("stats", {})
+        result["solved"] = False
+        result["error"] = detail.get("message", "").strip().splitlines()[0] if detail.get("message") else None
+    result["wallSeconds"] = round(time.perf_counter() - started, 3)
+    peak = _peak_rss_mb()
+    result["peakMemoryMB"] = round(peak, 1) if peak is not None else None
+    for key in ("firstSolutionSeconds", "solveSeconds", "backtracks", "constraintsChecked",
+                "softScore", "variablesAssigned", "totalVariables"):
+        if key in stats:
+            result[key] = stats[key]
+    return result
+
+
+def run_benchmark(instances: Dict[str, GeneratePayload], strategies: List[str], seeds: List[int],
+                  time_limit: float, log=print) -> List[Dict[str, Any]]:
+    """Run every instance x strategy x seed, each in its own spawned process."""
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for name, payload in instances.items():
+        payload = payload.model_copy(update={"timeLimitSeconds": time_limit})
+        sessions = sum(1 if a["type"] == "Lab" else max(1, int(a["creditHours"]))
+                       for a in payload.assignments)
+        for strategy in strategies:
+            for seed in seeds:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(run_case, payload, strategy, seed).result()
+                result = {"instance": name, "strategy": strategy, "seed": seed, "sessions": sessions, **result}
+                results.append(result)
+                log(format_result(result))
+    return results
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    first = result.get("firstSolutionSeconds")
+    return (f"{result['instance']:<20} {result['strategy']:<18} {result['seed']:>6} "
+            f"{'ok' if result['solved'] else 'FAIL':>4} {result['wallSeconds']:>8.2f}s "
+            f"{(f'{first:.2f}s' if first is not None else '-'):>8} "
+            f"bt={result.get('backtracks', '-'):<8} cc={result.get('constraintsChecked', '-'):<10} "
+            f"soft={result.get('softScore', '-'):<8} mem={result.get('peakMemoryMB', '-')}MB")
+
+
+def compare_results(old: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> List[str]:
+    """Regressions of new against old, one line each, for cases present in both."""
+    before = {(r["instance"], r["strategy"], r["seed"]): r for r in old}
+    regressions = []
+    for r in new:
+        o = before.get((r["instance"], r["strategy"], r["seed"]))
+        if o is None:
+            continue
+        case = f"{r['instance']} / {r['strategy']} / {r['seed']}"
+        if o["solved"] and not r["solved"]:
+            regressions.append(f"{case}: no longer solved")
+            continue
+        if not r["solved"]:
+            continue
+        if (r["wallSeconds"] > o["wallSeconds"] * COMPARE_SLOWDOWN
+                and r["wallSeconds"] - o["wallSeconds"] > COMPARE_MIN_SECONDS):
+            regressions.append(f"{case}: {o['wallSeconds']:.2f}s -> {r['wallSeconds']:.2f}s")
+        if o["solved"] and r.get("softScore", 0) > o.get("softScore", 0):
+            regressions.append(f"{case}: soft score {o.get('softScore')} -> {r.get('softScore')}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--instances", help="comma-separated instance names (default: all); "
+                        "'dataset' is the bundled CSV dataset, the rest synthetic")
+    parser.add_argument("--synthetic", action="append", default=[], metavar="NAME=KEY=VALUE,...",
+                        help="add a synthetic instance, e.g. big=classes=60,departments=4")
+    parser.add_argument("--payload", action="append", default=[], metavar="FILE",
+                        help="add a GeneratePayload JSON file as an instance named after the file, "
+                        "e.g. one saved by /timetables/profile")
+    parser.add_argument("--dataset", default=DATASET_PATH, help="folder holding the dataset CSVs")
+    parser.add_argument("--strategies", default=",".join(DEFAULT_STRATEGIES),
+                        help="comma-separated strategy names, see SOLVER_STRATEGIES")
+    parser.add_argument("--seeds", default="42", help="comma-separated solver seeds")
+    parser.add_argument("--time-limit", type=float, default=30.0, help="search budget per run in seconds")
+    parser.add_argument("--out", default="benchmark_results.json", help="results file to write")
+    parser.add_argument("--compare", help="earlier results file; exit 1 on regressions against it")
+    args = parser.parse_args(argv)
+
+    try:
+        strategies = resolve_strategies(args.strategies.split(","))
+    except ValueError as e:
+        parser.error(str(e))
+    seeds = [int(s) for s in args.seeds.split(",")]
+
+    specs: Dict[str, Any] = dict(SYNTHETIC_SUITE)
+    specs.update(parse_synthetic(spec) for spec in args.synthetic)
+    payloads = {os.path.splitext(os.path.basename(path))[0]: path for path in args.payload}
+    if args.instances:
+        names = args.instances.split(",")
+    elif payloads:
+        names = list(payloads)
+    else:
+        names = ["dataset"] + list(specs)
+    instances = {}
+    for name in names:
+        if name == "dataset":
+            instances[name] = load_dataset(args.dataset)
+        elif name in payloads:
+            with open(payloads[name], encoding="utf-8") as f:
+                instances[name] = GeneratePayload.model_validate_json(f.read())
+        elif name in specs:
+            instances[name] = synthetic_payload(**specs[name])
+        else:
+            parser.error(f"Unknown instance '{name}'. Known: dataset, {', '.join(specs)}")
+
+    results = run_benchmark(instances, strategies, seeds, args.time_limit)
+    report = {
+        "solverVersion": SOLVER_VERSION,
+        "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpuCount": os.cpu_count(),
+        "timeLimitSeconds": args.time_limit,
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare_results(json.load(f)["results"], results)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+import os
+
+import pytest
+
+# Keep the solver's per-run log lines out of the test output; read when app is imported
+os.environ.setdefault("CSP_LOG_LEVEL", "WARNING")
+
+import app  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client(tmp_path_factory):
+    """A client whose lifespan opens its job store in a temporary directory."""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(app, "CSP_JOBS_PATH", str(tmp_path_factory.mktemp("jobs") / "jobs.db"))
+        with TestClient(app.app) as client:
+            yield client
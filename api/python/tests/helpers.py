@@ -0,0 +1,69 @@
+"""Instances, request bodies and timetable checks shared by the tests."""
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from app import GeneratePayload, to_minutes
+from benchmark import SYNTHETIC_SUITE, synthetic_payload
+
+# synthetic_payload arguments of an instance with soft penalties left after
+# the CSP solve, so local search has something to improve
+TIGHT_LABS = {"classes": 8, "courses_per_class": 5, "lab_ratio": 0.5, "room_scarcity": 0.9, "seed": 3}
+
+
+def payload_json(institute: str, spec: Dict[str, Any] = SYNTHETIC_SUITE["small"], **overrides) -> Dict[str, Any]:
+    """A synthetic instance as a request body; institute keeps cache keys apart per test."""
+    body = synthetic_payload(**spec).model_dump(mode="json")
+    body.update(instituteID=institute, **overrides)
+    return body
+
+
+def tiny_payload(assignments: List[Dict[str, Any]], rooms: List[str],
+                 room_types: Optional[Dict[str, str]] = None, end: str = "11:00") -> GeneratePayload:
+    """One Monday from 09:00 to end, no breaks."""
+    return GeneratePayload(
+        instituteID="test",
+        session="Fall",
+        year=2025,
+        classes=sorted({a["class"] for a in assignments}),
+        assignments=assignments,
+        rooms=rooms,
+        roomTypes=room_types or {room: "Class" for room in rooms},
+        timeslots=[{"day": "Mon", "start": "09:00", "end": end}],
+        breaks={"mode": "none"},
+        algorithms=["CSP"],
+    )
+
+
+def lecture(cls: str, course: str, hours: int, instructor: str) -> Dict[str, Any]:
+    return {"class": cls, "course": course, "type": "Lecture", "creditHours": hours, "instructor": instructor}
+
+
+def clashes(details: List[Dict[str, Any]]) -> List[str]:
+    """Overlapping rows sharing a room, class or instructor."""
+    found = []
+    for field in ("roomNumber", "class", "instructorName"):
+        by_key = defaultdict(list)
+        for row in details:
+            start, end = (to_minutes(t) for t in row["time"].split("-"))
+            by_key[(row[field], row["day"])].append((start, end, row["course"]))
+        for (key, day), rows in by_key.items():
+            rows.sort()
+            busy_until, busy_with = rows[0][1], rows[0][2]
+            for start, end, course in rows[1:]:
+                if start < busy_until:
+                    found.append(f"{field} {key} on {day}: {busy_with} and {course}")
+                if end > busy_until:
+                    busy_until, busy_with = end, course
+    return found
+
+
+
+def misplaced_assignments(assignments: List[Dict[str, Any]], details: List[Dict[str, Any]]) -> List[str]:
+    """Assignments without their rows: one per credit hour for a lecture, a two or three slot block for a lab."""
+    rows: Dict[tuple, int] = defaultdict(int)
+    for row in details:
+        rows[(row["class"], row["course"])] += 1
+    expected = {(a["class"], a["course"]): ((2, 3) if a["type"] == "Lab" else (a["creditHours"],))
+                for a in assignments}
+    return [f"{cls} {course}: {rows.get((cls, course), 0)} rows" for (cls, course), counts in expected.items()
+            if rows.get((cls, course), 0) not in counts]
@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+
+import app
+from app import GeneratePayload, canonical_payload_hash
+from helpers import TIGHT_LABS, payload_json
+
+
+def test_generate_then_cache_hit(client):
+    body = payload_json("generate", algorithms=["CSP", "CSP+MAC"], candidateCount=2)
+    first = client.post("/timetables/generate", json=body)
+    assert first.status_code == 200
+    candidates = first.json()["candidates"]
+    assert len(candidates) == 2
+    assert not any(c["stats"].get("cached") for c in candidates)
+    
+    second = client.post("/timetables/generate", json=body)
+    assert second.status_code == 200
+    again = second.json()["candidates"]
+    assert all(c["stats"]["cached"] for c in again)
+    assert [c["details"] for c in again] == [c["details"] for c in candidates]
+
+
+def test_cut_short_run_is_not_cached(client):
+    body = payload_json("cut-short", TIGHT_LABS, algorithms=["CSP+TABU"], candidateCount=1,
+                        localSearchSeconds=0.001)
+    for _ in range(2):
+        stats = client.post("/timetables/generate", json=body).json()["candidates"][0]["stats"]
+        assert stats["cutShort"]
+        assert not stats.get("cached")
+
+
+def test_hash_ignores_run_selection_and_limits():
+    body = payload_json("hash")
+    same = payload_json("hash", algorithms=["CSP+TABU"], candidateCount=5, topK=1,
+                        timeLimitSeconds=1, localSearchSeconds=1)
+    other = payload_json("hash", slotMinutes=30)
+    assert canonical_payload_hash(GeneratePayload(**body)) == canonical_payload_hash(GeneratePayload(**same))
+    assert canonical_payload_hash(GeneratePayload(**body)) != canonical_payload_hash(GeneratePayload(**other))
+
+
+def test_import_opens_no_cache_database(tmp_path):
+    path = tmp_path / "cache.db"
+    script = ("import os, app; assert not os.path.exists(os.environ['CSP_CACHE_PATH']); "
+              "app.get_result_cache(); assert os.path.exists(os.environ['CSP_CACHE_PATH'])")
+    subprocess.run([sys.executable, "-c", script], check=True, cwd=os.path.dirname(app.__file__),
+                   env={**os.environ, "CSP_CACHE_PATH": str(path)})
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app import GeneratePayload, _generate_candidate_worker, decompose_payload, reconcile_candidates
+from benchmark import SYNTHETIC_SUITE
+from helpers import clashes, misplaced_assignments, payload_json
+
+
+def test_departments_split_into_parts():
+    payload = GeneratePayload(**payload_json("split", SYNTHETIC_SUITE["medium"]))
+    parts, components = decompose_payload(payload)
+    assert components == len(parts) == 2
+    # Parts share no class or instructor, and together hold every assignment
+    classes = [set(part.classes) for part in parts]
+    instructors = [{a["instructor"] for a in part.assignments} for part in parts]
+    assert not classes[0] & classes[1]
+    assert not instructors[0] & instructors[1]
+    assert classes[0] | classes[1] == set(payload.classes)
+    assert sum(len(part.assignments) for part in parts) == len(payload.assignments)
+
+
+def test_decomposed_run_is_a_valid_timetable(client):
+    body = payload_json("decompose", SYNTHETIC_SUITE["medium"], candidateCount=1)
+    candidate = client.post("/timetables/generate", json={**body, "decompose": True}).json()["candidates"][0]
+    
+    stats = candidate["stats"]
+    assert not stats.get("partial")
+    assert stats["decomposition"]["groups"] == 2
+    assert all(part is not None and part["unplaced"] == 0 for part in stats["decomposition"]["parts"])
+    assert clashes(candidate["details"]) == []
+    assert misplaced_assignments(body["assignments"], candidate["details"]) == []
+    assert stats["solveSeconds"] >= stats["decomposition"]["reconcileSeconds"]
+
+
+def test_reconciliation_gets_only_what_the_parts_left():
+    payload = GeneratePayload(**payload_json("budget", SYNTHETIC_SUITE["medium"], timeLimitSeconds=2))
+    parts, components = decompose_payload(payload)
+    solved = [_generate_candidate_worker(part, 42, "CSP")["candidate"] for part in parts]
+    spent = time.time() - payload.timeLimitSeconds
+    
+    with pytest.raises(HTTPException) as error:
+        reconcile_candidates(payload, 42, "CSP", solved, components, run_started=spent)
+    assert error.value.status_code == 400
+    assert error.value.detail["timedOut"]
+    
+    payload.allowPartial = True
+    stats = reconcile_candidates(payload, 42, "CSP", solved, components, run_started=spent)["stats"]
+    assert stats["partial"]
+    assert stats["timedOut"]
+    assert stats["cutShort"]
+
+
+def test_parts_stop_at_the_run_deadline():
+    payload = GeneratePayload(**payload_json("deadline", SYNTHETIC_SUITE["medium"]))
+    part = decompose_payload(payload)[0][0]
+    stats = _generate_candidate_worker(part, 42, "CSP", deadline=time.time())["candidate"]["stats"]
+    assert stats["partial"]
+    assert stats["timedOut"]
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+import app
+from app import JOB_FINISHED, GeneratePayload
+from benchmark import SYNTHETIC_SUITE
+from helpers import payload_json
+
+
+def wait_for_job(client, job_id: str, seconds: float = 60.0):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        job = client.get(f"/timetables/jobs/{job_id}").json()
+        if job["status"] in JOB_FINISHED:
+            return job
+        time.sleep(0.1)
+    pytest.fail(f"job {job_id} did not finish within {seconds} s")
+
+
+def test_job_runs_to_completion(client):
+    created = client.post("/timetables/jobs", json=payload_json("job", candidateCount=2))
+    assert created.status_code == 202
+    job_id = created.json()["jobId"]
+    
+    job = wait_for_job(client, job_id)
+    assert job["status"] == "completed"
+    assert job["best"] is not None
+    candidates = client.get(f"/timetables/jobs/{job_id}/candidates").json()["candidates"]
+    assert len(candidates) == 2
+
+
+def test_job_cancel(client):
+    body = payload_json("cancel", SYNTHETIC_SUITE["medium"], algorithms=["CSP+TABU"], candidateCount=16)
+    job_id = client.post("/timetables/jobs", json=body).json()["jobId"]
+    
+    cancelled = client.post(f"/timetables/jobs/{job_id}/cancel")
+    assert cancelled.status_code == 200
+    assert cancelled.json()["status"] == "cancelled"
+    assert client.get(f"/timetables/jobs/{job_id}").json()["status"] == "cancelled"
+    # Cancelling a finished job leaves it as it was
+    assert client.post(f"/timetables/jobs/{job_id}/cancel").json()["status"] == "cancelled"
+
+
+def test_job_rejects_unknown_algorithm(client):
+    assert client.post("/timetables/jobs", json=payload_json("job-bad", algorithms=["CSP+FAST"])).status_code == 400
+
+
+def test_unknown_job(client):
+    assert client.get("/timetables/jobs/nope").status_code == 404
+    assert client.get("/timetables/jobs/nope/candidates").status_code == 404
+    assert client.post("/timetables/jobs/nope/cancel").status_code == 404
+
+
+def test_job_that_cannot_start_fails(client):
+    # As when a resumed job names an algorithm that has since been removed
+    job_id = app.job_store.create(GeneratePayload(**payload_json("job-gone", algorithms=["CSP+GONE"])))
+    
+    async def resume():
+        app.start_job(job_id)
+    
+    client.portal.call(resume)
+    job = wait_for_job(client, job_id)
+    assert job["status"] == "failed"
+    assert "GONE" in job["error"]["message"]
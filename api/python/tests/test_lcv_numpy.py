@@ -0,0 +1,20 @@
+import pytest
+
+from app import generate_candidate, np
+from benchmark import SYNTHETIC_SUITE, synthetic_payload
+from helpers import TIGHT_LABS
+
+pytestmark = pytest.mark.skipif(np is None, reason="needs numpy")
+
+# Stats that depend on the strategy name or the clock
+UNCOMPARED_STATS = {"strategy", "solveSeconds", "firstSolutionSeconds"}
+
+
+@pytest.mark.parametrize("spec", [TIGHT_LABS, SYNTHETIC_SUITE["per-day-breaks"]], ids=["tight-labs", "per-day-breaks"])
+@pytest.mark.parametrize("modifiers", ["", "+MAC+WDEG", "+NOGOODS+SYMMETRY", "+TABU"])
+def test_numpy_ordering_matches_python(spec, modifiers):
+    python = generate_candidate(synthetic_payload(**spec), 7, "CSP" + modifiers)
+    vectorized = generate_candidate(synthetic_payload(**spec), 7, "CSP-NUMPY" + modifiers)
+    assert vectorized["details"] == python["details"]
+    assert ({k: v for k, v in vectorized["stats"].items() if k not in UNCOMPARED_STATS}
+            == {k: v for k, v in python["stats"].items() if k not in UNCOMPARED_STATS})
@@ -0,0 +1,26 @@
+from app import GeneratePayload, generate_candidate
+from helpers import payload_json
+
+
+def test_metrics(client):
+    client.post("/timetables/generate", json=payload_json("metrics", candidateCount=1))
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE csp_runs_total counter" in response.text
+    assert 'csp_runs_total{strategy="CSP",outcome="complete"}' in response.text
+    assert "# TYPE csp_solve_seconds histogram" in response.text
+
+
+def test_instrumented_run_reports_phases_and_trace():
+    payload = GeneratePayload(**payload_json("instrument", instrument=True, traceEvery=10))
+    plain = generate_candidate(GeneratePayload(**payload_json("instrument")), 42)
+    candidate = generate_candidate(payload, 42)
+    # Instrumentation only observes the search
+    assert candidate["details"] == plain["details"]
+    assert "instrumentation" not in plain["stats"]
+    
+    instrumentation = candidate["stats"]["instrumentation"]
+    assert instrumentation["phases"]["forwardChecking"]["calls"] > 0
+    assert instrumentation["nodes"] > 0
+    assert len(instrumentation["trace"]) == instrumentation["nodes"] // 10
@@ -0,0 +1,69 @@
+from app import CSPSolver, generate_candidate, normalize_breaks
+from helpers import clashes, lecture, payload_json, tiny_payload
+
+
+def partial(payload):
+    payload.allowPartial = True
+    candidate = generate_candidate(payload, 42)
+    assert candidate["stats"]["partial"]
+    assert clashes(candidate["details"]) == []
+    return candidate
+
+
+def test_unplaced_sessions_explain_their_clashes():
+    # Two rooms for two hours hold four of the six sessions
+    candidate = partial(tiny_payload([lecture(cls, f"{cls} C1", 2, f"I{cls}") for cls in "ABC"], ["R1", "R2"]))
+    assert len(candidate["details"]) == 4
+    assert candidate["stats"]["unplacedCount"] == len(candidate["unplaced"]) == 2
+    for unplaced in candidate["unplaced"]:
+        assert set(unplaced) == {"class", "course", "type", "instructor", "reason", "blockedBy"}
+        assert unplaced["reason"].startswith("All 4 placements clash")
+        assert unplaced["blockedBy"]["room"] > 0
+
+
+def test_unplaced_session_without_placements():
+    candidate = partial(tiny_payload(
+        [lecture("A", "C1", 1, "I1"),
+         {"class": "A", "course": "C1L", "type": "Lab", "creditHours": 3, "instructor": "I1"}],
+        ["R1", "Lab1"], {"R1": "Class", "Lab1": "Lab"}, end="10:00"))
+    assert [row["course"] for row in candidate["details"]] == ["C1"]
+    [unplaced] = candidate["unplaced"]
+    assert unplaced["course"] == "C1L"
+    assert unplaced["reason"].startswith("No room and time combination fits")
+    assert unplaced["blockedBy"] == {"room": 0, "class": 0, "instructor": 0}
+
+
+def test_generate_ranks_partial_candidates(client):
+    # One hour a week cannot hold every class's sessions
+    body = payload_json("partial", candidateCount=2, timeslots=[{"day": "Mon", "start": "09:00", "end": "10:00"}])
+    assert client.post("/timetables/generate", json=body).status_code == 400
+    
+    body["allowPartial"] = True
+    for _ in range(2):
+        candidates = client.post("/timetables/generate", json=body).json()["candidates"]
+        assert len(candidates) == 2
+        for candidate in candidates:
+            assert candidate["stats"]["partial"]
+            assert candidate["unplaced"]
+            # Partial results are not cached
+            assert not candidate["stats"].get("cached")
+        assert [len(c["unplaced"]) for c in candidates] == sorted(len(c["unplaced"]) for c in candidates)
+
+
+def test_fill_stops_at_the_solver_deadline():
+    payload = tiny_payload([lecture(cls, f"{cls} C1", 2, f"I{cls}") for cls in "ABC"], ["R1", "R2"])
+    normalize_breaks(payload)
+    filled, late = (CSPSolver(payload, 42, max_seconds=30, strategy="CSP") for _ in range(2))
+    assert not filled.solve() and not late.solve()
+    
+    late.max_seconds = 0
+    late_partial = late.get_partial_solution()
+    assert late_partial["stats"]["cutShort"]
+    assert len(late_partial["details"]) < len(filled.get_partial_solution()["details"]) == 4
+    # Unplaced sessions are still explained after the deadline
+    assert late_partial["stats"]["unplacedCount"] == len(late_partial["unplaced"]) > 2
+    
+    for var in late.variables:
+        table = late.domains[var.id].table
+        mask = late._root_mask(var)
+        assert late._root_values(var) == [value for bit, value in enumerate(table.values) if mask >> bit & 1]
@@ -0,0 +1,35 @@
+import base64
+import io
+import marshal
+
+from app import GeneratePayload, canonical_payload_hash
+from helpers import payload_json
+
+
+def test_profile(client):
+    body = payload_json("profile")
+    response = client.post("/timetables/profile", json={"payload": body, "top": 5, "sortBy": "tottime"})
+    assert response.status_code == 200
+    result = response.json()
+    assert result["solved"]
+    assert result["payloadHash"] == canonical_payload_hash(GeneratePayload(**body))
+    hot = result["hotFunctions"]
+    assert len(hot) == 5
+    assert [f["totalSeconds"] for f in hot] == sorted((f["totalSeconds"] for f in hot), reverse=True)
+    # The artifact is what pstats.Stats.dump_stats writes: a marshalled stats table
+    assert result["profile"]["format"] == "pstats"
+    stats = marshal.load(io.BytesIO(base64.b64decode(result["profile"]["data"])))
+    assert any(function == "solve" for _, _, function in stats)
+
+
+def test_profile_of_a_failed_run(client):
+    body = payload_json("profile-fail", timeslots=[{"day": "Mon", "start": "09:00", "end": "10:00"}])
+    result = client.post("/timetables/profile", json={"payload": body}).json()
+    assert not result["solved"]
+    assert result["error"]["message"].startswith("CSP Solver failed")
+    assert result["hotFunctions"]
+
+
+def test_profile_rejects_unknown_sort(client):
+    response = client.post("/timetables/profile", json={"payload": payload_json("profile-bad"), "sortBy": "wall"})
+    assert response.status_code == 422
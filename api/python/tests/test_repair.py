@@ -0,0 +1,87 @@
+import pytest
+
+from helpers import clashes, misplaced_assignments, payload_json
+
+
+@pytest.fixture(scope="module")
+def timetable(client):
+    """The small instance and its CSP timetable."""
+    body = payload_json("repair", candidateCount=1)
+    return body, client.post("/timetables/generate", json=body).json()["candidates"][0]["details"]
+
+
+def repair(client, body, details, delta, **extra):
+    return client.post("/timetables/repair", json={"payload": body, "details": details, "delta": delta, **extra})
+
+
+def test_repair_after_room_removal(client, timetable):
+    body, details = timetable
+    room = details[0]["roomNumber"]
+    response = repair(client, body, details, {"removeRooms": [room]})
+    assert response.status_code == 200
+    result = response.json()
+    repaired = result["candidate"]["details"]
+    assert all(row["roomNumber"] != room for row in repaired)
+    assert clashes(repaired) == []
+    assert misplaced_assignments(body["assignments"], repaired) == []
+    assert 0 < result["repair"]["moved"] < len(details) // 2
+    assert result["repair"]["removed"] == 0
+
+
+@pytest.mark.parametrize("algorithm", ["CSP+ANNEAL", "CSP+TABU"])
+def test_local_search_leaves_the_repair_alone(client, timetable, algorithm):
+    body, details = timetable
+    delta = {"removeRooms": [details[0]["roomNumber"]]}
+    plain = repair(client, body, details, delta).json()
+    searched = repair(client, body, details, delta, algorithm=algorithm).json()
+    assert searched["repair"]["moved"] == plain["repair"]["moved"]
+    assert searched["candidate"]["details"] == plain["candidate"]["details"]
+
+
+def test_instructor_change_moves_nothing_when_free(client, timetable):
+    body, details = timetable
+    row = details[0]
+    response = repair(client, body, details, {"instructorChanges": [
+        {"class": row["class"], "course": row["course"], "instructor": "New Instructor"}]})
+    result = response.json()
+    assert result["repair"]["moved"] == 0
+    assert {r["instructorName"] for r in result["candidate"]["details"]
+            if (r["class"], r["course"]) == (row["class"], row["course"])} == {"New Instructor"}
+
+
+def test_added_assignment_is_placed_around_the_rest(client, timetable):
+    body, details = timetable
+    added = {"class": body["classes"][0], "course": "New Course", "type": "Lecture", "creditHours": 2,
+             "instructor": "New Instructor"}
+    result = repair(client, body, details, {"addAssignments": [added]}).json()
+    repaired = result["candidate"]["details"]
+    assert result["repair"]["moved"] == 0
+    assert misplaced_assignments(body["assignments"] + [added], repaired) == []
+    assert clashes(repaired) == []
+
+
+def test_repair_that_cannot_finish(client, timetable):
+    body, details = timetable
+    # One classroom left: every round runs out of time
+    body = {**body, "timeLimitSeconds": 1}
+    delta = {"removeRooms": [room for room in body["rooms"] if not room.startswith("Lab")][1:]}
+    response = repair(client, body, details, delta)
+    assert response.status_code == 400
+    assert "allowPartial" in response.json()["detail"]["hint"]
+    
+    partial = repair(client, {**body, "allowPartial": True}, details, delta).json()["candidate"]
+    assert partial["stats"]["partial"]
+    assert partial["unplaced"]
+    assert clashes(partial["details"]) == []
+
+
+def test_repair_rejects_malformed_rows(client, timetable):
+    body, _ = timetable
+    response = repair(client, body, [{"class": "D1 Class 1", "time": "9-10"}], {})
+    assert response.status_code == 400
+    assert "details[0]" in response.json()["detail"]["message"]
+
+
+def test_repair_rejects_unknown_algorithm(client, timetable):
+    body, details = timetable
+    assert repair(client, body, details, {}, algorithm="CSP+FAST").status_code == 400
@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from app import CSPSolver, CSPVariable, normalize_breaks
+from benchmark import synthetic_payload
+from helpers import TIGHT_LABS
+
+
+def full_scan_score(solver: CSPSolver, var: CSPVariable, assignment) -> float:
+    """calculate_soft_constraint_score recomputed by scanning every variable, as before the aggregates."""
+    room, day, time_slots = assignment
+    others = [v for v in solver.variables
+              if v.id != var.id and v.assignment is not None and v.assignment[1] == day]
+    same_course = [v for v in others if v.class_name == var.class_name and v.course == var.course]
+    class_count = sum(1 for v in others if v.class_name == var.class_name)
+    instructor_count = sum(1 for v in others if var.instructor and v.instructor == var.instructor)
+    
+    score = len(same_course) * 12
+    if class_count == 4:
+        score += 0.5 * 6
+    elif class_count == 5:
+        score += 2 * 6
+    elif class_count > 5:
+        score += (class_count - 4) * 3 * 6
+    if any(solver._slots_adjacent(time_slots, v.assignment[2]) for v in same_course):
+        score += 15
+    if instructor_count > 5:
+        score += (instructor_count - 5) * 4
+    score += solver._penalty_time_preference(time_slots) * 2
+    class_slots = sorted([slot for v in others if v.class_name == var.class_name for slot in v.assignment[2]]
+                         + list(time_slots))
+    gaps = 0
+    for (_, end), (start, _) in zip(class_slots, class_slots[1:]):
+        if start - end > 60:
+            gaps += (start - end - 60) / 60.0
+    score += gaps * 7
+    score += solver._penalty_room_type_mismatch(var.session_type, room) * 3
+    return score
+
+
+def full_scan_total(solver: CSPSolver) -> float:
+    return sum(full_scan_score(solver, var, var.assignment) for var in solver.variables if var.assignment is not None)
+
+
+def solved(strategy: str) -> CSPSolver:
+    payload = synthetic_payload(**TIGHT_LABS)
+    normalize_breaks(payload)
+    solver = CSPSolver(payload, 42, max_seconds=30, strategy=strategy)
+    assert solver.solve()
+    return solver
+
+
+@pytest.mark.parametrize("strategy", ["CSP", "CSP+ANNEAL", "CSP+TABU"])
+def test_total_matches_full_scan(strategy):
+    # Local search moves sessions back and forth, so the aggregates see many updates
+    solver = solved(strategy)
+    assert solver.total_soft_score() > 0
+    assert solver.total_soft_score() == pytest.approx(full_scan_total(solver), abs=1e-9)
+
+
+def test_candidate_scores_match_full_scan_while_partly_assigned():
+    solver = solved("CSP")
+    rng = random.Random(0)
+    removed = rng.sample(solver.variables, len(solver.variables) // 3)
+    for var in removed:
+        solver.unassign(var)
+    for var in removed[:20]:
+        for value in solver._root_values(var)[:50]:
+            assert solver.calculate_soft_constraint_score(var, value) == pytest.approx(
+                full_scan_score(solver, var, value), abs=1e-9)
+    assert solver.total_soft_score() == pytest.approx(full_scan_total(solver), abs=1e-9)
@@ -0,0 +1,98 @@
+from typing import Any, Dict, Optional
+
+import pytest
+from fastapi import HTTPException
+
+from app import SOLVER_MODIFIERS, SOLVER_STRATEGIES, generate_candidate, np, resolve_strategies
+from benchmark import SYNTHETIC_SUITE, synthetic_payload
+from helpers import TIGHT_LABS, clashes, lecture, tiny_payload
+
+# Every base strategy, and every modifier on plain CSP
+MODES = ([pytest.param(name, marks=pytest.mark.skipif(
+              SOLVER_STRATEGIES[name].get("lcv_backend") == "numpy" and np is None, reason="needs numpy"))
+          for name in SOLVER_STRATEGIES]
+         + [f"CSP+{modifier}" for modifier in SOLVER_MODIFIERS]
+         + ["CSP+MAC+WDEG", "CSP+NOGOODS+SYMMETRY", "CSP+AC3+TABU"])
+
+
+INSTANCES = {
+    "small": lambda: synthetic_payload(**SYNTHETIC_SUITE["small"]),
+    "tight-labs": lambda: synthetic_payload(**TIGHT_LABS),
+    "per-day-breaks": lambda: synthetic_payload(classes=8, courses_per_class=5, break_mode="per-day", seed=1),
+    # Three one-hour sessions of a class, two hours in the week
+    "class-pigeonhole": lambda: tiny_payload(
+        [lecture("A", "C1", 2, "I1"), lecture("A", "C2", 1, "I2")], ["R1", "R2"]),
+    # One instructor teaching three classes, two hours in the week
+    "instructor-pigeonhole": lambda: tiny_payload(
+        [lecture(cls, f"{cls} C1", 1, "I1") for cls in "ABC"], ["R1", "R2", "R3"]),
+    # A room for two of three classes at each hour
+    "room-pigeonhole": lambda: tiny_payload(
+        [lecture(cls, f"{cls} C1", 2, f"I{cls}") for cls in "ABC"], ["R1", "R2"]),
+    # A lab, which needs two consecutive hours at least, in a one-hour day
+    "short-day-lab": lambda: tiny_payload(
+        [{"class": "A", "course": "C1L", "type": "Lab", "creditHours": 3, "instructor": "I1"}],
+        ["Lab1"], {"Lab1": "Lab"}, end="10:00"),
+}
+
+
+def solve(instance: str, strategy: str, seed: int = 42) -> Optional[Dict[str, Any]]:
+    """The candidate for instance, or None when the solver proves it has none."""
+    payload = INSTANCES[instance]()
+    payload.timeLimitSeconds = 30
+    try:
+        return generate_candidate(payload, seed, strategy)
+    except HTTPException as e:
+        assert e.status_code == 400
+        assert not e.detail.get("stats", {}).get("timedOut"), "an unsat verdict must not be a timeout"
+        return None
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    """Plain CSP's verdict per instance."""
+    return {instance: solve(instance, "CSP") is not None for instance in INSTANCES}
+
+
+def test_baseline_verdicts(baseline):
+    assert baseline == {
+        "small": True, "tight-labs": True, "per-day-breaks": True,
+        "class-pigeonhole": False, "instructor-pigeonhole": False,
+        "room-pigeonhole": False, "short-day-lab": False,
+    }
+
+
+@pytest.mark.parametrize("strategy", MODES)
+@pytest.mark.parametrize("instance", INSTANCES)
+def test_mode_agrees_with_csp(baseline, instance, strategy):
+    candidate = solve(instance, strategy)
+    assert (candidate is not None) == baseline[instance]
+    if candidate is None:
+        return
+    stats = candidate["stats"]
+    assert not stats.get("partial")
+    assert not stats.get("unplaced")
+    assert clashes(candidate["details"]) == []
+    if stats["softScoreBefore"] is not None:
+        assert stats["softScore"] <= stats["softScoreBefore"]
+
+
+@pytest.mark.parametrize("strategy", ["CSP", "CSP-FIRSTFIT", "CSP+MAC+WDEG", "CSP+NOGOODS", "CSP+ANNEAL", "CSP+TABU"])
+def test_same_seed_same_timetable(strategy):
+    first = solve("tight-labs", strategy, seed=7)
+    second = solve("tight-labs", strategy, seed=7)
+    assert first["details"] == second["details"]
+    assert first["stats"]["softScore"] == second["stats"]["softScore"]
+
+
+def test_local_search_improves_soft_score():
+    for strategy in ("CSP+ANNEAL", "CSP+TABU"):
+        stats = solve("tight-labs", strategy)["stats"]
+        assert stats["softScore"] < stats["softScoreBefore"]
+        assert not stats["cutShort"]
+
+
+def test_strategy_names_are_normalized():
+    assert resolve_strategies(["csp+mac+wdeg", "CSP+WDEG+MAC", " csp-firstfit "]) == ["CSP+MAC+WDEG", "CSP-FIRSTFIT"]
+    assert resolve_strategies([]) == ["CSP"]
+    with pytest.raises(ValueError, match="FAST"):
+        resolve_strategies(["CSP+FAST"])
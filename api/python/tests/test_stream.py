@@ -0,0 +1,75 @@
+import asyncio
+import json
+from typing import Any, Dict, List
+
+import app
+from benchmark import SYNTHETIC_SUITE
+from helpers import payload_json
+
+
+def stream_events(client, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+    with client.stream("POST", "/timetables/generate/stream", json=body) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        return [json.loads(line) for line in response.iter_lines() if line]
+
+
+def test_stream_events(client):
+    # Long enough (about 2 s here) for the solver to report progress
+    body = payload_json("stream", SYNTHETIC_SUITE["medium"], algorithms=["CSP+TABU"], candidateCount=1)
+    events = stream_events(client, body)
+    kinds = [event["event"] for event in events]
+    assert kinds[0] == "start"
+    assert events[0]["runs"] == [{"run": 0, "strategy": "CSP+TABU", "seed": 42}]
+    assert "progress" in kinds
+    assert kinds.index("progress") < kinds.index("candidate")
+    assert kinds[-1] == "done"
+    assert kinds.count("candidate") == 1
+    assert events[-1]["ranking"] == [0]
+    progress = events[kinds.index("progress")]
+    assert progress["run"] == 0
+    assert 0 <= progress["variablesAssigned"] <= progress["totalVariables"]
+
+
+def test_stream_reports_failed_runs(client):
+    # One hour a week cannot hold every class's sessions
+    body = payload_json("stream-fail", candidateCount=1,
+                        timeslots=[{"day": "Mon", "start": "09:00", "end": "10:00"}])
+    events = stream_events(client, body)
+    assert [event["event"] for event in events] == ["start", "error", "done"]
+    assert events[1]["status"] == 400
+    assert events[-1] == {"event": "done", "candidates": 0, "ranking": []}
+
+
+def test_stream_rejects_unknown_algorithm(client):
+    response = client.post("/timetables/generate/stream", json=payload_json("stream-bad", algorithms=["CSP+FAST"]))
+    assert response.status_code == 400
+
+
+def test_disconnect_stops_running_solves(client, monkeypatch):
+    manager = app.get_progress_manager()
+    cancel_events = []
+    
+    class RecordingManager:
+        Queue = manager.Queue
+        
+        def Event(self):
+            cancel_events.append(manager.Event())
+            return cancel_events[-1]
+    
+    monkeypatch.setattr(app, "get_progress_manager", RecordingManager)
+    body = payload_json("stream-disconnect", SYNTHETIC_SUITE["medium"], algorithms=["CSP+TABU"], candidateCount=1)
+    
+    async def disconnect():
+        response = await app.generate_stream(app.GeneratePayload(**body))
+        lines = response.body_iterator
+        assert json.loads(await lines.__anext__())["event"] == "start"
+        # The server cancels the response task when the client goes away
+        reader = asyncio.ensure_future(lines.__anext__())
+        await asyncio.sleep(0.3)
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+    
+    client.portal.call(disconnect)
+    assert len(cancel_events) == 1
+    assert cancel_events[0].is_set()
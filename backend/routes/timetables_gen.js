@@ -13,82 +13,105 @@ function keyFor(ttId, instituteID, year) {
   return `${ttId}_${instituteID}_${year}`;
 }
 
+// Error carrying the HTTP status to send back for invalid generate requests
+function requestError(status, message) {
+  const err = new Error(message);
+  err.status = status;
+  return err;
+}
+
+// Builds the Python generator payload from a generate request; throws requestError on invalid input
+async function buildGeneratePayload(req) {
+  let { instituteID } = req.user || {};
+  // Fallback to body.instituteID if user context missing (e.g., legacy tokens)
+  if (!instituteID && req.body && req.body.instituteID) {
+    instituteID = req.body.instituteID;
+  }
+  if (!instituteID) throw requestError(400, 'User has no institute');
+
+  const {
+    session,
+    year,
+    classes = [],
+    assignments = [],
+    rooms = [],
+    roomTypes = {},
+    timeslots: clientTimeslots = [],
+    breaks = {},
+    slotMinutes = 60
+  } = req.body || {};
+
+  if (!session || !year) throw requestError(400, 'Missing session/year');
+
+  // Validate assignments: Lecture must have positive creditHours; Lab forced to 3
+  if (!Array.isArray(assignments) || assignments.length === 0) {
+    throw requestError(400, 'At least one assignment is required');
+  }
+  const normalizedAssignments = (assignments || []).map((a, idx) => {
+    const type = a.type === 'Lab' ? 'Lab' : 'Lecture';
+    let creditHours = type === 'Lab' ? 3 : Number(a.creditHours);
+    if (type === 'Lecture') {
+      if (!Number.isFinite(creditHours) || creditHours < 1) {
+        throw requestError(400, `Assignment ${a.course || `#${idx+1}`} missing/invalid creditHours`);
+      }
+      creditHours = Math.floor(creditHours);
+    }
+    return {
+      class: String(a.class),
+      course: String(a.course),
+      type,
+      creditHours,
+      instructor: String(a.instructor || '')
+    };
+  });
+
+  // Load institute time window per day from DB and transform to generator format
+  const dayMap = {
+    Monday: 'Mon', Tuesday: 'Tue', Wednesday: 'Wed', Thursday: 'Thu', Friday: 'Fri', Saturday: 'Sat', Sunday: 'Sun'
+  };
+  const tsList = await TimeSlot.find({ instituteID }).sort({ timeSlotID: 1 }).lean();
+  if (!tsList || tsList.length === 0) {
+    throw requestError(400, 'No time slots defined for this institute');
+  }
+  const timeslots = tsList.map(ts => ({
+    day: dayMap[ts.days] || ts.days,
+    start: ts.startTime,
+    end: ts.endTime
+  }));
+
+  return {
+    instituteID,
+    session: String(session),
+    year: Number(year),
+    classes,
+    assignments: normalizedAssignments,
+    rooms,
+    roomTypes,
+    timeslots,
+    breaks,
+    slotMinutes: Number(slotMinutes) || 60,
+    algorithms: ['CSP']
+  };
+}
+
+// Reads a JSON body from a stream response (e.g. an upstream error); null if it is not JSON
+async function readJsonStream(stream) {
+  const chunks = [];
+  for await (const chunk of stream) chunks.push(chunk);
+  try {
+    return JSON.parse(Buffer.concat(chunks).toString('utf8'));
+  } catch {
+    return null;
+  }
+}
+
 // POST /api/timetables-gen/generate
 // Expects: { session, year, instituteID, classes, assignments, rooms, roomTypes, timeslots, breaks }
 // assignments: [{ class, course, type: 'Lecture'|'Lab', creditHours, instructor }]; enforce Lab creditHours=3
 // breaks: { mode: 'same'|'per-day', same?: { start, end }, perDay?: { Mon:{start,end}, ... } }
 router.post('/generate', protect, async (req, res) => {
   try {
-    let { instituteID } = req.user || {};
-    // Fallback to body.instituteID if user context missing (e.g., legacy tokens)
-    if (!instituteID && req.body && req.body.instituteID) {
-      instituteID = req.body.instituteID;
-    }
-    if (!instituteID) return res.status(400).json({ message: 'User has no institute' });
-
-    const {
-      session,
-      year,
-      classes = [],
-      assignments = [],
-      rooms = [],
-      roomTypes = {},
-      timeslots: clientTimeslots = [],
-      breaks = {},
-      slotMinutes = 60
-    } = req.body || {};
-
-    if (!session || !year) return res.status(400).json({ message: 'Missing session/year' });
-
-    // Validate assignments: Lecture must have positive creditHours; Lab forced to 3
-    if (!Array.isArray(assignments) || assignments.length === 0) {
-      return res.status(400).json({ message: 'At least one assignment is required' });
-    }
-    const normalizedAssignments = (assignments || []).map((a, idx) => {
-      const type = a.type === 'Lab' ? 'Lab' : 'Lecture';
-      let creditHours = type === 'Lab' ? 3 : Number(a.creditHours);
-      if (type === 'Lecture') {
-        if (!Number.isFinite(creditHours) || creditHours < 1) {
-          throw new Error(`Assignment ${a.course || `#${idx+1}`} missing/invalid creditHours`);
-        }
-        creditHours = Math.floor(creditHours);
-      }
-      return {
-        class: String(a.class),
-        course: String(a.course),
-        type,
-        creditHours,
-        instructor: String(a.instructor || '')
-      };
-    });
-
-    // Load institute time window per day from DB and transform to generator format
-    const dayMap = {
-      Monday: 'Mon', Tuesday: 'Tue', Wednesday: 'Wed', Thursday: 'Thu', Friday: 'Fri', Saturday: 'Sat', Sunday: 'Sun'
-    };
-    const tsList = await TimeSlot.find({ instituteID }).sort({ timeSlotID: 1 }).lean();
-    if (!tsList || tsList.length === 0) {
-      return res.status(400).json({ message: 'No time slots defined for this institute' });
-    }
-    const timeslots = tsList.map(ts => ({
-      day: dayMap[ts.days] || ts.days,
-      start: ts.startTime,
-      end: ts.endTime
-    }));
-
-    const payload = {
-      instituteID,
-      session: String(session),
-      year: Number(year),
-      classes,
-      assignments: normalizedAssignments,
-      rooms,
-      roomTypes,
-      timeslots,
-      breaks,
-      slotMinutes: Number(slotMinutes) || 60,
-      algorithms: ['CSP']
-    };
+    const payload = await buildGeneratePayload(req);
 
     const PY_API_URL = process.env.PY_API_URL || 'http://localhost:8000';
     const url = `${PY_API_URL}/timetables/generate`;
@@ -102,13 +125,55 @@ router.post('/generate', protect, async (req, res) => {
     return res.json({ candidates });
   } catch (err) {
     console.error('Generate timetable error:', err?.message || err);
+    if (err?.status) {
+      return res.status(err.status).json({ message: err.message });
+    }
     // Propagate Python API clash/validation errors with detail
     if (err?.response && err.response.status === 400) {
       const detail = err.response.data?.detail || err.response.data?.message || err.message;
       return res.status(400).json({ message: detail });
     }
-    if (String(err?.message || '').includes('missing/invalid creditHours')) {
-      return res.status(400).json({ message: err.message });
+    return res.status(500).json({ message: 'Failed to generate timetables' });
+  }
+});
+
+// POST /api/timetables-gen/generate/stream
+// Same body as /generate; pipes the Python API's NDJSON event stream
+// (start, progress, candidate, error, done) through without a request timeout
+router.post('/generate/stream', protect, async (req, res) => {
+  try {
+    const payload = await buildGeneratePayload(req);
+
+    const PY_API_URL = process.env.PY_API_URL || 'http://localhost:8000';
+    const url = `${PY_API_URL}/timetables/generate/stream`;
+
+    // res (not req) 'close' fires only once the client goes away or the
+    // response ends; req 'close' fires as soon as the body is consumed on Node >= 16
+    const upstream = new AbortController();
+    let response;
+    res.on('close', () => {
+      if (res.writableEnded) return;
+      upstream.abort();
+      response?.data.destroy();
+    });
+    response = await axios.post(url, payload, { responseType: 'stream', timeout: 0, signal: upstream.signal });
+    res.setHeader('Content-Type', 'application/x-ndjson');
+    res.setHeader('Cache-Control', 'no-cache');
+    res.flushHeaders();
+    // A dropped upstream connection ends the client's stream instead of crashing the process
+    response.data.on('error', () => res.destroy());
+    response.data.pipe(res);
+  } catch (err) {
+    if (axios.isCancel(err)) return;
+    console.error('Generate timetable stream error:', err?.message || err);
+    if (err?.status) {
+      return res.status(err.status).json({ message: err.message });
+    }
+    // Propagate Python API clash/validation errors with detail, read from the error stream
+    if (err?.response && err.response.status === 400) {
+      const body = await readJsonStream(err.response.data).catch(() => null);
+      const detail = body?.detail || body?.message || err.message;
+      return res.status(400).json({ message: detail });
     }
     return res.status(500).json({ message: 'Failed to generate timetables' });
   }